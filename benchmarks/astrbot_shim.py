@@ -0,0 +1,105 @@
+"""Minimal stand-ins for the parts of ``astrbot.api`` that main.py imports.
+
+Only installed when AstrBot itself is not importable, so the benchmarks also
+run inside a real AstrBot environment unchanged.
+"""
+
+import logging
+import sys
+import types
+from dataclasses import dataclass, field
+
+
+def install():
+    try:
+        import astrbot.api  # noqa: F401
+
+        return False
+    except ImportError:
+        pass
+
+    astrbot = types.ModuleType("astrbot")
+    api = types.ModuleType("astrbot.api")
+    event_mod = types.ModuleType("astrbot.api.event")
+    components = types.ModuleType("astrbot.api.message_components")
+    provider = types.ModuleType("astrbot.api.provider")
+
+    @dataclass
+    class FunctionTool:
+        name: str = ""
+        description: str = ""
+        parameters: dict = field(default_factory=dict)
+
+    class Star:
+        def __init__(self, context):
+            self.context = context
+
+    api.FunctionTool = FunctionTool
+    api.logger = logging.getLogger("astrbot")
+    api.star = types.SimpleNamespace(Star=Star, Context=object)
+
+    class _Filter:
+        class EventMessageType:
+            ALL = "all"
+
+        def event_message_type(self, *_args, **_kwargs):
+            return lambda fn: fn
+
+        def on_llm_request(self, *_args, **_kwargs):
+            return lambda fn: fn
+
+        def command(self, *_args, **_kwargs):
+            return lambda fn: fn
+
+    class AstrMessageEvent:
+        pass
+
+    class MessageChain:
+        def __init__(self):
+            self.chain = []
+
+        def message(self, text):
+            self.chain.append(text)
+            return self
+
+    event_mod.AstrMessageEvent = AstrMessageEvent
+    event_mod.filter = _Filter()
+    event_mod.MessageChain = MessageChain
+
+    class File:
+        def __init__(self, file="", name="", **_kwargs):
+            self.file = file
+            self.name = name
+
+    class Image:
+        def __init__(self, path):
+            self.path = path
+
+        @classmethod
+        def fromFileSystem(cls, path):
+            return cls(path)
+
+    class Plain:
+        def __init__(self, text):
+            self.text = text
+
+    components.File = File
+    components.Image = Image
+    components.Plain = Plain
+
+    class ProviderRequest:
+        def __init__(self):
+            self.system_prompt = ""
+
+    provider.ProviderRequest = ProviderRequest
+    astrbot.api = api
+    sys.modules.update(
+        {
+            "astrbot": astrbot,
+            "astrbot.api": api,
+            "astrbot.api.event": event_mod,
+            "astrbot.api.message_components": components,
+            "astrbot.api.provider": provider,
+        }
+    )
+    return True
@@ -0,0 +1,285 @@
+"""In-process stand-in for ``e2b_code_interpreter.AsyncSandbox``.
+
+Each fake sandbox owns a temporary directory that plays the role of the remote
+filesystem: absolute ``/home/user`` and ``/tmp`` paths in code, commands and
+file calls are rewritten into it. ``run_code`` executes Python on a worker
+thread with per-call stdout/stderr capture and streaming callbacks delivered on
+the event loop; it never changes the process cwd, so sandbox code should use
+absolute paths. ``commands.run`` shells out to bash, and every remote operation can be given an injected latency so plugin overhead can
+be measured separately from network cost.
+"""
+
+import asyncio
+import functools
+import io
+import itertools
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+
+_code_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="fake-e2b-kernel")
+_thread_streams = threading.local()
+
+
+class _StreamRouter(io.TextIOBase):
+    """Sends writes from a run_code worker thread to that call's sink; other threads pass through."""
+
+    def __init__(self, name, fallback):
+        self.name = name
+        self.fallback = fallback
+
+    def write(self, text):
+        sink = getattr(_thread_streams, self.name, None)
+        if sink is None:
+            return self.fallback.write(text)
+        if text:
+            sink(text)
+        return len(text)
+
+    def flush(self):
+        if getattr(_thread_streams, self.name, None) is None:
+            self.fallback.flush()
+
+
+def _install_stream_router():
+    for name in ("stdout", "stderr"):
+        current = getattr(sys, name)
+        if not isinstance(current, _StreamRouter):
+            setattr(sys, name, _StreamRouter(name, current))
+
+
+class CommandExitException(Exception):
+    """Mirrors the SDK's exception for commands that exit non-zero."""
+
+    def __init__(self, exit_code, stdout, stderr):
+        super().__init__(f"exit {exit_code}: {stderr}")
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+
+
+class _ClassOrInstanceMethod:
+    """Mirrors the SDK's methods that work both as ``Sandbox.kill(sandbox_id)`` and ``sandbox.kill()``."""
+
+    def __init__(self, class_method, instance_method):
+        self.class_method = class_method
+        self.instance_method = instance_method
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return functools.partial(self.class_method, objtype)
+        return functools.partial(self.instance_method, obj)
+
+
+class FakeAsyncSandbox:
+    """Class-level registry, counters and latency are shared by all instances."""
+
+    latency = {}
+    registry = {}
+    counters = {}
+    _ids = itertools.count(1)
+
+    def __init__(self, sandbox_id, template=""):
+        self.sandbox_id = sandbox_id
+        self.template = template
+        self.root = tempfile.mkdtemp(prefix=f"fake-e2b-{sandbox_id}-")
+        os.makedirs(os.path.join(self.root, "home/user"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+        self.state = "running"
+        self.namespace = {}
+        self.commands = _Commands(self)
+        self.files = _Files(self)
+
+    @classmethod
+    def reset(cls, latency=None):
+        for sandbox in list(cls.registry.values()):
+            shutil.rmtree(sandbox.root, ignore_errors=True)
+        cls.registry.clear()
+        cls.counters.clear()
+        cls.latency = dict(latency or {})
+
+    @classmethod
+    async def _delay(cls, name):
+        cls.counters[name] = cls.counters.get(name, 0) + 1
+        delay = cls.latency.get(name, 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+
+    @classmethod
+    async def create(cls, api_key=None, timeout=None, proxy=None, template=None):
+        await cls._delay("create")
+        sandbox = cls(f"sbx{next(cls._ids)}", template or "")
+        cls.registry[sandbox.sandbox_id] = sandbox
+        return sandbox
+
+    @classmethod
+    async def connect(cls, sandbox_id, api_key=None, proxy=None, timeout=None):
+        await cls._delay("connect")
+        sandbox = cls.registry.get(sandbox_id)
+        if sandbox is None or sandbox.state == "killed":
+            raise RuntimeError(f"sandbox {sandbox_id} not found")
+        sandbox.state = "running"
+        return sandbox
+
+    async def pause(self):
+        await self._delay("pause")
+        self.state = "paused"
+
+    async def _kill_instance(self):
+        await self._delay("kill")
+        self.state = "killed"
+        shutil.rmtree(self.root, ignore_errors=True)
+        return True
+
+    async def _kill_by_id(cls, sandbox_id, api_key=None, proxy=None):
+        sandbox = cls.registry.get(sandbox_id)
+        if sandbox is None or sandbox.state == "killed":
+            await cls._delay("kill")
+            return False
+        return await sandbox._kill_instance()
+
+    kill = _ClassOrInstanceMethod(_kill_by_id, _kill_instance)
+
+    async def is_running(self):
+        return self.state == "running"
+
+    async def set_timeout(self, timeout):
+        self._check()
+        await self._delay("set_timeout")
+
+    def _check(self):
+        if self.state != "running":
+            raise RuntimeError(f"sandbox {self.sandbox_id} is {self.state}")
+
+    def map_path(self, text):
+        return re.sub(r"(?<![\w.\-/])/(home/user|tmp/)", lambda m: self.root + "/" + m.group(1), text)
+
+    def unmap_path(self, text):
+        return text.replace(self.root, "")
+
+    async def run_code(self, code, on_stdout=None, on_stderr=None, on_result=None, timeout=None, **_kwargs):
+        self._check()
+        await self._delay("run_code")
+        loop = asyncio.get_running_loop()
+        stdout, stderr, results = [], [], []
+        sandbox_root = self.root
+
+        def forward(sink, callback, text):
+            text = text.replace(sandbox_root, "")
+            sink.append(text)
+            if callback:
+                loop.call_soon_threadsafe(callback, types.SimpleNamespace(line=text))
+
+        def emit_result(**kwargs):
+            result = types.SimpleNamespace(png=None, jpeg=None, svg=None, text=None)
+            result.__dict__.update(kwargs)
+            results.append(result)
+            if on_result:
+                loop.call_soon_threadsafe(on_result, result)
+
+        def execute():
+            _thread_streams.stdout = lambda text: forward(stdout, on_stdout, text)
+            _thread_streams.stderr = lambda text: forward(stderr, on_stderr, text)
+            try:
+                exec(compile(self.map_path(code), "<sandbox>", "exec"), self.namespace)
+            except Exception as exc:
+                return types.SimpleNamespace(name=type(exc).__name__, value=str(exc), traceback="")
+            finally:
+                _thread_streams.stdout = None
+                _thread_streams.stderr = None
+            return None
+
+        # Code may call _fake_emit_result(png=...) to simulate rich display output.
+        self.namespace["_fake_emit_result"] = emit_result
+        _install_stream_router()
+        error = await loop.run_in_executor(_code_executor, execute)
+        return types.SimpleNamespace(
+            logs=types.SimpleNamespace(stdout=stdout, stderr=stderr),
+            results=results,
+            error=error,
+            text=None,
+        )
+
+
+class _CommandHandle:
+    def __init__(self, pid):
+        self.pid = pid
+        self.disconnected = False
+
+    async def disconnect(self):
+        self.disconnected = True
+
+
+class _Commands:
+    def __init__(self, sandbox):
+        self.sandbox = sandbox
+        self.procs = {}
+
+    async def run(self, cmd, timeout=None, background=False, **_kwargs):
+        self.sandbox._check()
+        await self.sandbox._delay("command")
+        mapped = self.sandbox.map_path(cmd)
+        cwd = os.path.join(self.sandbox.root, "home/user")
+        if background:
+            proc = subprocess.Popen(["bash", "-c", mapped], cwd=cwd)
+            self.procs[proc.pid] = proc
+            return _CommandHandle(proc.pid)
+        proc = await asyncio.to_thread(
+            subprocess.run,
+            ["bash", "-c", mapped],
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+            cwd=cwd,
+        )
+        stdout = self.sandbox.unmap_path(proc.stdout)
+        stderr = self.sandbox.unmap_path(proc.stderr)
+        if proc.returncode != 0:
+            raise CommandExitException(proc.returncode, stdout, stderr)
+        return types.SimpleNamespace(stdout=stdout, stderr=stderr, exit_code=0)
+
+    async def kill(self, pid):
+        proc = self.procs.pop(pid, None)
+        if proc is None:
+            return False
+        proc.kill()
+        return True
+
+
+class _Files:
+    def __init__(self, sandbox):
+        self.sandbox = sandbox
+
+    async def write(self, path, data, **_kwargs):
+        self.sandbox._check()
+        await self.sandbox._delay("file")
+        local = self.sandbox.map_path(path)
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        if hasattr(data, "read"):
+            data = data.read()
+        mode = "w" if isinstance(data, str) else "wb"
+        with open(local, mode) as file_obj:
+            file_obj.write(data)
+        return types.SimpleNamespace(path=path)
+
+    async def read(self, path, format="text", **_kwargs):
+        self.sandbox._check()
+        await self.sandbox._delay("file")
+        with open(self.sandbox.map_path(path), "rb") as file_obj:
+            data = file_obj.read()
+        if format == "bytes":
+            return bytearray(data)
+        if format == "stream":
+            async def _stream():
+                for index in range(0, len(data), 65536):
+                    yield data[index:index + 65536]
+
+            return _stream()
+        return data.decode("utf-8")
@@ -0,0 +1,97 @@
+"""Wires main.Main to the fake sandbox and minimal AstrBot event/context objects."""
+
+import os
+import sys
+import tempfile
+import types
+
+from . import astrbot_shim
+from .fake_sandbox import FakeAsyncSandbox
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_USER_ID = "bench-user"
+LATENCY_PROFILES = {
+    "zero": {},
+    "realistic": {
+        "create": 0.8,
+        "connect": 0.3,
+        "pause": 0.2,
+        "kill": 0.1,
+        "command": 0.05,
+        "file": 0.05,
+        "run_code": 0.1,
+    },
+}
+
+
+def load_plugin_module():
+    astrbot_shim.install()
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    import main as plugin_main
+
+    plugin_main.AsyncSandbox = FakeAsyncSandbox
+    return plugin_main
+
+
+class FakeContext:
+    def __init__(self):
+        self.tools = []
+        self.sent = []
+
+    def add_llm_tools(self, *tools):
+        self.tools.extend(tools)
+
+    async def send_message(self, session, chain):
+        self.sent.append((session, chain))
+
+
+class FakeFileComponent:
+    type = "file"
+
+    def __init__(self, path: str, name: str = ""):
+        self.path = path
+        self.name = name or os.path.basename(path)
+        self.file = None
+        self.file_id = None
+        self.file_size = os.path.getsize(path)
+        self.url = None
+
+
+class FakeEvent:
+    def __init__(self, session_id: str, user_id: str = BENCH_USER_ID, files=(), admin: bool = False):
+        self.unified_msg_origin = session_id
+        self.message_obj = types.SimpleNamespace(
+            group_id="",
+            sender=types.SimpleNamespace(user_id=user_id),
+            message=list(files),
+            raw_message=None,
+        )
+        self.sent = []
+        self._user_id = user_id
+        self._admin = admin
+
+    def get_sender_id(self):
+        return self._user_id
+
+    def is_admin(self):
+        return self._admin
+
+    def chain_result(self, chain):
+        return chain
+
+    async def send(self, chain):
+        self.sent.append(chain)
+
+
+def make_plugin(config=None, latency_profile: str = "zero"):
+    """Build a fresh plugin instance with its own data directory and sandbox registry."""
+    plugin_main = load_plugin_module()
+    data_dir = tempfile.mkdtemp(prefix="e2b-bench-data-")
+    plugin_main.get_astrbot_data_path = lambda: data_dir
+    FakeAsyncSandbox.reset(LATENCY_PROFILES[latency_profile])
+
+    plugin_config = {"e2b_api_key": "bench", "user_whitelist": [BENCH_USER_ID]}
+    plugin_config.update(config or {})
+    return plugin_main.Main(FakeContext(), plugin_config), data_dir
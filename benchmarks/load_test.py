@@ -0,0 +1,225 @@
+"""Concurrent-session load test against the fake sandbox backend.
+
+Simulates many chat groups at once. Each simulated turn delivers a message
+through remember_session_files (sometimes with an attachment), injects the
+system prompt through inject_file_hint, then calls one tool picked from a
+weighted mix. While it runs, the script samples event-loop lag and records how
+long every tool waited on its session lock.
+
+Usage (from the repository root):
+
+    python -m benchmarks.load_test --sessions 300 --turns 5
+    python -m benchmarks.load_test --sessions 100 --profile realistic --think-ms 500
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import shutil
+import time
+import types
+from collections import defaultdict
+
+from .fake_sandbox import FakeAsyncSandbox
+from .harness import LATENCY_PROFILES, FakeEvent, FakeFileComponent, make_plugin
+from .run_benchmarks import percentile
+
+TOOL_MIX = (
+    ("run_python_code", 60),
+    ("status", 15),
+    ("list_files", 10),
+    ("pause", 5),
+    ("resume", 5),
+    ("create", 5),
+)
+
+current_tool = contextvars.ContextVar("current_tool", default="background")
+
+
+class TimedLock:
+    """Wraps a session lock and attributes acquisition wait to the calling tool."""
+
+    def __init__(self, lock, lock_waits):
+        self._lock = lock
+        self._lock_waits = lock_waits
+
+    def locked(self):
+        return self._lock.locked()
+
+    async def __aenter__(self):
+        started_at = time.perf_counter()
+        await self._lock.acquire()
+        self._lock_waits[current_tool.get()].append(time.perf_counter() - started_at)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._lock.release()
+        return False
+
+
+async def sample_loop_lag(samples, interval, stop):
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+async def call_tool(plugin, tool, event, turn):
+    if tool == "run_python_code":
+        code = f"total = sum(range({1000 + turn}))\nprint(total, {turn})"
+        return await plugin.run_python_code(event, code=code)
+    if tool == "status":
+        return await plugin.get_session_sandbox_status(event)
+    if tool == "list_files":
+        return await plugin.e2b_list_files(event)
+    if tool == "pause":
+        return await plugin.pause_session_sandbox(event)
+    if tool == "resume":
+        return await plugin.resume_session_sandbox(event)
+    return await plugin.create_session_sandbox(event)
+
+
+async def simulate_session(plugin, index, args, rng, attachment, tool_latencies):
+    session_id = f"load:group:{index}"
+    users = [f"load-user-{index}-{n}" for n in range(args.users_per_session)]
+    tools, weights = zip(*TOOL_MIX)
+    for turn in range(args.turns):
+        if args.think_ms:
+            await asyncio.sleep(rng.expovariate(1000.0 / args.think_ms))
+        user_id = rng.choice(users)
+        files = [FakeFileComponent(attachment)] if rng.random() < args.attachment_ratio else []
+
+        token = current_tool.set("remember_session_files")
+        started_at = time.perf_counter()
+        await plugin.remember_session_files(FakeEvent(session_id, user_id=user_id, files=files))
+        tool_latencies["remember_session_files"].append(time.perf_counter() - started_at)
+
+        current_tool.set("inject_file_hint")
+        started_at = time.perf_counter()
+        await plugin.inject_file_hint(FakeEvent(session_id, user_id=user_id), types.SimpleNamespace(system_prompt=""))
+        tool_latencies["inject_file_hint"].append(time.perf_counter() - started_at)
+
+        tool = rng.choices(tools, weights=weights)[0]
+        current_tool.set(tool)
+        started_at = time.perf_counter()
+        try:
+            await call_tool(plugin, tool, FakeEvent(session_id, user_id=user_id), turn)
+        except Exception as exc:
+            logging.getLogger("astrbot").error(f"[E2B] load test {tool} failed: {exc}")
+        tool_latencies[tool].append(time.perf_counter() - started_at)
+        current_tool.reset(token)
+
+
+async def run_load_test(args):
+    users = [f"load-user-{i}-{n}" for i in range(args.sessions) for n in range(args.users_per_session)]
+    plugin, data_dir = make_plugin(
+        {"user_whitelist": users, "auto_pause_idle_seconds": args.auto_pause_idle_seconds},
+        latency_profile=args.profile,
+    )
+    attachment = os.path.join(data_dir, "shared.csv")
+    with open(attachment, "w", encoding="utf-8") as file_obj:
+        file_obj.write("a,b\n" * (args.attachment_kb * 256))
+
+    lock_waits = defaultdict(list)
+    original_get_session_lock = plugin._get_session_lock
+    plugin._get_session_lock = lambda session_id: TimedLock(original_get_session_lock(session_id), lock_waits)
+
+    tool_latencies = defaultdict(list)
+    lag_samples = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(sample_loop_lag(lag_samples, args.lag_interval_ms / 1000.0, stop))
+    rng = random.Random(args.seed)
+    try:
+        started_at = time.perf_counter()
+        await asyncio.gather(
+            *(
+                simulate_session(plugin, index, args, random.Random(rng.random()), attachment, tool_latencies)
+                for index in range(args.sessions)
+            )
+        )
+        wall = time.perf_counter() - started_at
+    finally:
+        stop.set()
+        await lag_task
+        await plugin.terminate()
+        sandbox_calls = dict(sorted(FakeAsyncSandbox.counters.items()))
+        FakeAsyncSandbox.reset()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    def describe(samples):
+        return {
+            "count": len(samples),
+            "p50": percentile(samples, 0.5),
+            "p95": percentile(samples, 0.95),
+            "p99": percentile(samples, 0.99),
+            "max": max(samples) if samples else 0.0,
+        }
+
+    turns = args.sessions * args.turns
+    return {
+        "sessions": args.sessions,
+        "turns": turns,
+        "profile": args.profile,
+        "wall_seconds": wall,
+        "turns_per_second": turns / wall if wall else 0.0,
+        "loop_lag": describe(lag_samples),
+        "tools": {tool: describe(samples) for tool, samples in sorted(tool_latencies.items())},
+        "lock_waits": {tool: describe(samples) for tool, samples in sorted(lock_waits.items())},
+        "sandbox_calls": sandbox_calls,
+    }
+
+
+def print_report(result):
+    def row(name, stats):
+        return (
+            f"  {name:<24} n={stats['count']:<6} p50={stats['p50'] * 1000:8.1f}ms "
+            f"p95={stats['p95'] * 1000:8.1f}ms p99={stats['p99'] * 1000:8.1f}ms max={stats['max'] * 1000:8.1f}ms"
+        )
+
+    print(
+        f"== load test: {result['sessions']} sessions, {result['turns']} turns (profile={result['profile']}) =="
+    )
+    print(f"wall: {result['wall_seconds']:.2f}s  throughput: {result['turns_per_second']:.1f} turns/s")
+    print("event loop lag:")
+    print(row("loop", result["loop_lag"]))
+    print("tool latency:")
+    for tool, stats in result["tools"].items():
+        print(row(tool, stats))
+    print("session lock wait:")
+    for tool, stats in result["lock_waits"].items():
+        print(row(tool, stats))
+    print("sandbox calls: " + ", ".join(f"{k}={v}" for k, v in result["sandbox_calls"].items()))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--users-per-session", type=int, default=3)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--think-ms", type=float, default=200.0, help="Mean think time between turns.")
+    parser.add_argument("--attachment-ratio", type=float, default=0.1)
+    parser.add_argument("--attachment-kb", type=int, default=256)
+    parser.add_argument("--profile", choices=sorted(LATENCY_PROFILES), default="zero")
+    parser.add_argument("--auto-pause-idle-seconds", type=int, default=30)
+    parser.add_argument("--lag-interval-ms", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default="", help="Also write results to this JSON file.")
+    return parser.parse_args(argv)
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+    result = await run_load_test(args)
+    print_report(result)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as file_obj:
+            json.dump(result, file_obj, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,198 @@
+"""Offline benchmarks for the E2B sandbox plugin.
+
+Drives Main.run_python_code and the lifecycle tools against FakeAsyncSandbox
+and reports throughput, client-side latency percentiles, the plugin's own
+per-phase breakdown and the number of sandbox roundtrips per scenario.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --scenario many_sessions --sessions 100 --profile realistic
+    python -m benchmarks.run_benchmarks --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+
+from .fake_sandbox import FakeAsyncSandbox
+from .harness import LATENCY_PROFILES, FakeEvent, FakeFileComponent, make_plugin
+
+
+def percentile(samples, quantile):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(quantile * len(ordered) + 0.5) - 1))]
+
+
+async def timed(latencies, coro):
+    started_at = time.perf_counter()
+    result = await coro
+    latencies.append(time.perf_counter() - started_at)
+    return result
+
+
+async def scenario_many_sessions(plugin, data_dir, args):
+    """Many sessions, each running several short executions back to back."""
+    latencies = []
+
+    async def session_worker(index):
+        event = FakeEvent(f"bench:session:{index}")
+        for run in range(args.runs):
+            await timed(latencies, plugin.run_python_code(event, code=f"x = {index} * {run}\nprint(x)"))
+
+    await asyncio.gather(*(session_worker(index) for index in range(args.sessions)))
+    return latencies
+
+
+async def scenario_big_output(plugin, data_dir, args):
+    """Executions that stream a lot of stdout through the callbacks."""
+    latencies = []
+    event = FakeEvent("bench:big-output")
+    for run in range(args.runs):
+        code = f"for i in range({args.output_lines}):\n    print('line', i, {run}, 'x' * 80)"
+        await timed(latencies, plugin.run_python_code(event, code=code))
+    return latencies
+
+
+async def scenario_many_files(plugin, data_dir, args):
+    """Executions that leave many generated files behind for collection."""
+    latencies = []
+    event = FakeEvent("bench:many-files")
+    for run in range(args.runs):
+        code = (
+            "import os\n"
+            "os.makedirs('/home/user/uploads', exist_ok=True)\n"
+            f"for i in range({args.files}):\n"
+            f"    path = f'/home/user/uploads/report_{run}_{{i}}.csv'\n"
+            "    with open(path, 'w') as fh:\n"
+            "        fh.write('a,b\\n' * 2000)\n"
+            "    print(path)\n"
+        )
+        await timed(latencies, plugin.run_python_code(event, code=code))
+    return latencies
+
+
+async def scenario_large_attachment(plugin, data_dir, args):
+    """A large attachment read by several executions in the same session."""
+    latencies = []
+    attachment = os.path.join(data_dir, "attachment.bin")
+    with open(attachment, "wb") as file_obj:
+        file_obj.write(os.urandom(args.attachment_mb * 1024 * 1024))
+
+    session_id = "bench:attachment"
+    await plugin.remember_session_files(FakeEvent(session_id, files=[FakeFileComponent(attachment)]))
+    event = FakeEvent(session_id)
+    for run in range(args.runs):
+        code = f"print(len(open('/home/user/uploads/attachment.bin', 'rb').read()), {run})"
+        await timed(latencies, plugin.run_python_code(event, code=code))
+    return latencies
+
+
+async def scenario_lifecycle(plugin, data_dir, args):
+    """create/status/pause/resume/kill across many sessions."""
+    latencies = []
+
+    async def session_worker(index):
+        event = FakeEvent(f"bench:lifecycle:{index}")
+        await timed(latencies, plugin.create_session_sandbox(event))
+        await timed(latencies, plugin.get_session_sandbox_status(event))
+        await timed(latencies, plugin.pause_session_sandbox(event))
+        await timed(latencies, plugin.resume_session_sandbox(event))
+        await timed(latencies, plugin.kill_session_sandbox(event))
+
+    await asyncio.gather(*(session_worker(index) for index in range(args.sessions)))
+    return latencies
+
+
+SCENARIOS = {
+    "many_sessions": scenario_many_sessions,
+    "big_output": scenario_big_output,
+    "many_files": scenario_many_files,
+    "large_attachment": scenario_large_attachment,
+    "lifecycle": scenario_lifecycle,
+}
+
+
+async def run_scenario(name, args):
+    plugin, data_dir = make_plugin(
+        {"auto_pause_idle_seconds": args.auto_pause_idle_seconds},
+        latency_profile=args.profile,
+    )
+    try:
+        started_at = time.perf_counter()
+        latencies = await SCENARIOS[name](plugin, data_dir, args)
+        wall = time.perf_counter() - started_at
+
+        phases = {}
+        for template in plugin._latency.templates():
+            for phase in plugin._latency.phases(template):
+                phases[phase] = plugin._latency.quantiles(template, phase)
+        return {
+            "scenario": name,
+            "profile": args.profile,
+            "ops": len(latencies),
+            "wall_seconds": wall,
+            "ops_per_second": len(latencies) / wall if wall else 0.0,
+            "latency": {f"p{int(q * 100)}": percentile(latencies, q) for q in (0.5, 0.95, 0.99)},
+            "phases": {
+                phase: {f"p{int(q * 100)}": value for q, value in quantiles.items()}
+                for phase, quantiles in phases.items()
+            },
+            "sandbox_calls": dict(sorted(FakeAsyncSandbox.counters.items())),
+        }
+    finally:
+        await plugin.terminate()
+        FakeAsyncSandbox.reset()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def print_report(result):
+    print(f"== {result['scenario']} (profile={result['profile']}) ==")
+    print(
+        f"ops: {result['ops']}  wall: {result['wall_seconds']:.2f}s  "
+        f"throughput: {result['ops_per_second']:.1f} ops/s"
+    )
+    print("op latency: " + "  ".join(f"{k}={v * 1000:.1f}ms" for k, v in result["latency"].items()))
+    for phase, quantiles in result["phases"].items():
+        print(f"  {phase:<10} " + "  ".join(f"{k}={v * 1000:.1f}ms" for k, v in quantiles.items()))
+    print("sandbox calls: " + ", ".join(f"{k}={v}" for k, v in result["sandbox_calls"].items()))
+    print()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["all", *SCENARIOS], default="all")
+    parser.add_argument("--profile", choices=sorted(LATENCY_PROFILES), default="zero")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output-lines", type=int, default=20000)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--attachment-mb", type=int, default=20)
+    parser.add_argument("--auto-pause-idle-seconds", type=int, default=30)
+    parser.add_argument("--json", dest="json_path", default="", help="Also write results to this JSON file.")
+    return parser.parse_args(argv)
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    results = []
+    for name in names:
+        result = await run_scenario(name, args)
+        print_report(result)
+        results.append(result)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as file_obj:
+            json.dump(results, file_obj, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
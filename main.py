@@ -1,20 +1,31 @@
 import ast
 import asyncio
 import base64
+import gzip
 import hashlib
+import heapq
 import inspect
+import ipaddress
 import json
+import logging
+import logging.handlers
 import os
 import posixpath
 import re
 import shutil
+import sqlite3
+import sys
 import tempfile
+import threading
 import time
 import traceback
-import urllib.request
+import uuid
+import urllib.parse
 import base64 as py_base64
 import zipfile
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from io import BytesIO
 from pathlib import Path
@@ -22,7 +33,7 @@ from typing import Any
 
 import astrbot.api.message_components as Comp
 from astrbot.api import FunctionTool, logger, star
-from astrbot.api.event import AstrMessageEvent, filter
+from astrbot.api.event import AstrMessageEvent, MessageChain, filter
 from astrbot.api.message_components import Image
 from astrbot.api.provider import ProviderRequest
 
@@ -31,6 +42,21 @@ try:
 except ImportError:
     get_astrbot_data_path = None
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    PILImage = None
+
+try:
+    import cairosvg
+except (ImportError, OSError):
+    cairosvg = None
+
 try:
     from e2b_code_interpreter import AsyncSandbox
 except ImportError:
@@ -49,12 +75,73 @@ DEFAULT_WORK_DIR = "/home/user"
 DEFAULT_EXPORT_DIRNAME = "exports"
 MAX_RESULT_LIMIT = 20000
 MAX_SESSION_FILE_COUNT = 5
+MAX_CONCURRENT_UPLOADS = 4
+UPLOAD_FILE_TIMEOUT_SECONDS = 120
+UPLOAD_MIN_BYTES_PER_SECOND = 512 * 1024
+MAX_UPLOAD_TOTAL_MB = 200
+DEFAULT_MAX_UPLOAD_FILE_SIZE_MB = 50
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_CONCURRENT_DOWNLOADS = 4
+DOWNLOAD_MAX_RESUME_ATTEMPTS = 3
+FILE_URL_CACHE_TTL_SECONDS = 300
+MAX_FILE_URL_CACHE_SIZE = 256
 MAX_GENERATED_FILE_CANDIDATES = 3
 DEFAULT_MAX_RETURN_FILE_SIZE_MB = 5
 DEFAULT_FILE_RETENTION_HOURS = 24
 DEFAULT_SESSION_RETENTION_HOURS = 12
 DEFAULT_SANDBOX_TIMEOUT = 600
 DEFAULT_DUPLICATE_EXEC_WINDOW_SECONDS = 10
+DEFAULT_WARM_POOL_SIZE = 0
+DEFAULT_WARM_POOL_MAX_IDLE_MINUTES = 30
+MAX_WARM_POOL_SIZE = 10
+WARM_POOL_REFILL_INTERVAL_SECONDS = 30
+MAX_SANDBOX_HANDLE_CACHE_SIZE = 32
+SANDBOX_HANDLE_VALIDATE_AFTER_SECONDS = 30
+SANDBOX_HANDLE_TTL_MARGIN_SECONDS = 30
+DEFAULT_AUTO_PAUSE_IDLE_SECONDS = 30
+MAX_AUTO_PAUSE_IDLE_SECONDS = 300
+SPECULATIVE_PREWARM_HOLD_SECONDS = 60
+LATENCY_SAMPLE_WINDOW = 512
+LATENCY_QUANTILES = (0.5, 0.95, 0.99)
+LATENCY_PHASES = (
+    "lock_wait",
+    "sandbox",
+    "stage",
+    "install",
+    "snapshot",
+    "execute",
+    "images",
+    "files",
+    "release",
+    "total",
+)
+METRICS_FLUSH_INTERVAL_SECONDS = 10
+DEFAULT_LOOP_WATCHDOG_MS = 500
+MAX_CAPTURED_RESULTS = 32
+DEFAULT_MAX_IMAGES_PER_EXECUTION = 4
+MAX_IMAGES_PER_EXECUTION = 20
+IMAGE_DISPATCH_WAIT_SECONDS = 10
+IMAGE_WORKER_COUNT = 2
+DEFAULT_IMAGE_MAX_DIMENSION = 2048
+DEFAULT_IMAGE_MAX_SIZE_KB = 1024
+MIN_IMAGE_DIMENSION = 320
+IMAGE_REENCODE_QUALITY = 85
+IMAGE_SHRINK_FACTOR = 0.75
+SVG_RASTER_SCALE = 2
+IMAGE_FORMAT_EXTENSIONS = {"PNG": ".png", "JPEG": ".jpg", "WEBP": ".webp"}
+OUTPUT_SPOOL_DIRNAME = "output_spool"
+MAX_OUTPUT_SPOOL_CHARS = 20 * 1024 * 1024
+OUTPUT_SPOOL_FLUSH_CHARS = 256 * 1024
+MAX_OUTPUT_PATTERN_LENGTH = 200
+OUTPUT_MARKER_RESERVE = 60
+MAX_OUTPUT_PATTERN_SCAN_CHARS = 5 * 1024 * 1024
+MAX_SPOOLED_EXECUTIONS = 3
+OUTPUT_STREAMS = ("stdout", "stderr", "result")
+MIN_LOOP_WATCHDOG_MS = 50
+DIAGNOSTICS_LOG_MAX_BYTES = 1024 * 1024
+DIAGNOSTICS_LOG_BACKUP_COUNT = 3
+REAPER_MAX_CONCURRENT_KILLS = 4
+REAPER_MAX_SLEEP_SECONDS = 3600
 PLUGIN_NAME = "astrbot_plugin_e2b_sandbox"
 SANDBOX_PATH_PATTERN = re.compile(r"(/home/user(?:/[\w\-. \u4e00-\u9fff]+)+)")
 
@@ -73,6 +160,286 @@ IMPORT_PACKAGE_MAP = {
     "sklearn": "scikit-learn",
     "wordcloud": "wordcloud",
 }
+PACKAGE_IMPORT_MAP = {package: module for module, package in IMPORT_PACKAGE_MAP.items()}
+PLOT_CODE_PATTERN = re.compile(r"\bplt\.|\.plot\(|\.plot\.|\.hist\(|savefig\(")
+PLOT_FONT_NAME = "SimHei.ttf"
+SANDBOX_PLOT_FONT_PATH = f"/tmp/{PLOT_FONT_NAME}"
+
+SANDBOX_HELPER_DIR = "/tmp/astrbot_e2b"
+SANDBOX_HELPER_PATH = f"{SANDBOX_HELPER_DIR}/helper.py"
+SANDBOX_HELPER_VERSION = 6
+SANDBOX_HELPER_MISSING_MARKER = "__ASTRBOT_E2B_HELPER_MISSING__"
+JOB_ROOT_DIR = f"{SANDBOX_HELPER_DIR}/jobs"
+DEFAULT_JOB_TIMEOUT = 3600
+MAX_JOB_TIMEOUT = 86400
+JOB_KILL_GRACE_SECONDS = 10
+MAX_RUNNING_JOBS_PER_SESSION = 2
+MAX_JOB_HISTORY_PER_SESSION = 10
+JOB_POLL_INTERVAL_SECONDS = 15
+JOB_MAX_POLL_FAILURES = 3
+JOB_NOTIFY_TAIL_CHARS = 800
+JOB_TIMEOUT_EXIT_CODE = 124
+SANDBOX_HELPER_SCRIPT = r'''
+import base64
+import codecs
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import signal
+import sys
+import time
+
+VERSION = __VERSION__
+STATE_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_PATH = os.path.join(STATE_DIR, "snapshot.json")
+
+
+def scan(dirs):
+    manifest = {}
+    for base_dir in dirs:
+        try:
+            entries = os.scandir(base_dir)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat_result = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                manifest[entry.path] = {"size": stat_result.st_size, "mtime": stat_result.st_mtime}
+    return manifest
+
+
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as file_obj:
+        for chunk in iter(lambda: file_obj.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def op_snapshot(args):
+    for path in args.get("mkdirs", []):
+        os.makedirs(path, exist_ok=True)
+    manifest = scan(args.get("dirs", []))
+    with open(SNAPSHOT_PATH, "w", encoding="utf-8") as file_obj:
+        json.dump({"snapshot_id": args.get("snapshot_id"), "manifest": manifest}, file_obj)
+    return {"manifest": manifest}
+
+
+def op_collect(args):
+    try:
+        with open(SNAPSHOT_PATH, "r", encoding="utf-8") as file_obj:
+            saved = json.load(file_obj)
+    except (OSError, ValueError):
+        saved = {}
+    if saved.get("snapshot_id") != args.get("snapshot_id"):
+        raise RuntimeError("snapshot mismatch")
+    os.remove(SNAPSHOT_PATH)
+
+    before = saved.get("manifest", {})
+    after = scan(args.get("dirs", []))
+    exclude_names = set(args.get("exclude_names", []))
+    max_bytes = int(args.get("max_bytes", 0))
+    wanted = [path for path, meta in after.items() if before.get(path) != meta]
+    wanted += [path for path in args.get("paths", []) if path in after and path not in wanted]
+
+    files = {}
+    for path in wanted:
+        if os.path.basename(path) in exclude_names:
+            continue
+        size = after[path]["size"]
+        info = {"size": size}
+        if 0 < size <= max_bytes:
+            try:
+                info["md5"] = file_md5(path)
+            except OSError as exc:
+                info["error"] = str(exc)
+        files[path] = info
+    return {"manifest": after, "files": files}
+
+
+def op_discard_snapshot(args):
+    try:
+        with open(SNAPSHOT_PATH, "r", encoding="utf-8") as file_obj:
+            saved = json.load(file_obj)
+    except (OSError, ValueError):
+        return {"removed": False}
+    if saved.get("snapshot_id") != args.get("snapshot_id"):
+        return {"removed": False}
+    os.remove(SNAPSHOT_PATH)
+    return {"removed": True}
+
+
+def op_fetch(args):
+    files = {}
+    for path in args.get("paths", []):
+        try:
+            with open(path, "rb") as file_obj:
+                content = file_obj.read()
+        except OSError as exc:
+            files[path] = {"error": str(exc)}
+            continue
+        files[path] = {
+            "size": len(content),
+            "md5": hashlib.md5(content).hexdigest(),
+            "content": base64.b64encode(content).decode("ascii"),
+        }
+    return {"files": files}
+
+
+def op_verify(args):
+    verified = []
+    for path, expected in args.get("files", {}).items():
+        try:
+            if os.path.getsize(path) != expected.get("size"):
+                continue
+            if file_md5(path) == expected.get("md5"):
+                verified.append(path)
+        except OSError:
+            continue
+    return {"verified": verified}
+
+
+def op_probe_packages(args):
+    importable = []
+    for name in args.get("modules", []):
+        try:
+            if importlib.util.find_spec(name) is not None:
+                importable.append(name)
+        except (ImportError, ValueError):
+            continue
+    return {"importable": importable, "installer": "uv" if shutil.which("uv") else "pip"}
+
+
+def read_increment(path, offset, limit):
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    result = {"size": size, "offset": offset, "text": "", "skipped": 0}
+    if limit <= 0 or size <= offset:
+        return result
+    if size - offset > limit:
+        result["skipped"] = size - limit - offset
+        offset = size - limit
+    with open(path, "rb") as file_obj:
+        file_obj.seek(offset)
+        data = file_obj.read(limit)
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    result["text"] = decoder.decode(data)
+    result["offset"] = offset + len(data) - len(decoder.getstate()[0])
+    return result
+
+
+def read_tail(path, limit):
+    try:
+        with open(path, "rb") as file_obj:
+            file_obj.seek(max(0, os.path.getsize(path) - limit))
+            return file_obj.read().decode("utf-8", "replace")
+    except OSError:
+        return ""
+
+
+def job_pid(job_dir):
+    try:
+        with open(os.path.join(job_dir, "pid"), "r", encoding="utf-8") as file_obj:
+            return int(file_obj.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def job_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def job_state(job_dir):
+    try:
+        with open(os.path.join(job_dir, "exit_code"), "r", encoding="utf-8") as file_obj:
+            exit_code = int(file_obj.read().strip())
+    except (OSError, ValueError):
+        exit_code = None
+    if exit_code is not None:
+        cancelled = os.path.exists(os.path.join(job_dir, "cancelled"))
+        return ("cancelled" if cancelled else "finished"), exit_code
+    pid = job_pid(job_dir)
+    if pid is None or job_alive(pid):
+        return "running", None
+    return "lost", None
+
+
+def op_job_status(args):
+    job_dir = args["job_dir"]
+    state, exit_code = job_state(job_dir)
+    offsets = args.get("offsets", {})
+    limit = int(args.get("limit", 0))
+    tail = int(args.get("tail", 0))
+    result = {"state": state, "exit_code": exit_code}
+    for stream in ("stdout", "stderr"):
+        path = os.path.join(job_dir, f"{stream}.log")
+        result[stream] = read_increment(path, int(offsets.get(stream, 0)), limit)
+        if tail > 0:
+            result[stream]["tail"] = read_tail(path, tail)
+    return result
+
+
+def op_job_cancel(args):
+    job_dir = args["job_dir"]
+    state, exit_code = job_state(job_dir)
+    if state != "running":
+        return {"state": state, "exit_code": exit_code}
+    open(os.path.join(job_dir, "cancelled"), "w").close()
+    pid = job_pid(job_dir)
+    if pid is not None:
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(pid, sig)
+            except OSError:
+                break
+            deadline = time.time() + float(args.get("grace", 5))
+            while time.time() < deadline and job_alive(pid):
+                time.sleep(0.1)
+            if not job_alive(pid):
+                break
+    return {"state": "cancelled", "exit_code": None}
+
+
+OPS = {
+    "snapshot": op_snapshot,
+    "collect": op_collect,
+    "discard_snapshot": op_discard_snapshot,
+    "fetch": op_fetch,
+    "verify": op_verify,
+    "probe_packages": op_probe_packages,
+    "job_status": op_job_status,
+    "job_cancel": op_job_cancel,
+}
+
+
+def main():
+    try:
+        args = json.loads(sys.argv[2]) if len(sys.argv) > 2 else {}
+        result = OPS[sys.argv[1]](args)
+        response = {"version": VERSION, "ok": True, "result": result}
+    except Exception as exc:
+        response = {"version": VERSION, "ok": False, "error": f"{type(exc).__name__}: {exc}"}
+    sys.stdout.write(json.dumps(response, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
+'''.replace("__VERSION__", str(SANDBOX_HELPER_VERSION))
 
 
 @dataclass
@@ -97,7 +464,7 @@ class RunPythonCodeTool(FunctionTool):
                 },
                 "auto_pause": {
                     "type": "boolean",
-                    "description": "Whether to automatically pause the sandbox after execution. Default is true.",
+                    "description": "Whether to automatically pause the sandbox once it stays idle after execution. Default is true.",
                 },
             },
             "required": ["code"],
@@ -273,6 +640,831 @@ class SendFileTool(FunctionTool):
         return await self.plugin.e2b_send_file(event, file_name=file_name, file_index=file_index)
 
 
+@dataclass
+class ReadOutputTool(FunctionTool):
+    plugin: Any = field(repr=False, default=None)
+    name: str = "e2b_sandbox_read_output"
+    description: str = (
+        "Read more of a previous execution's full output when the run result was truncated. "
+        "Select a character range, a line range, or lines containing a text fragment instead of re-running the code."
+    )
+    parameters: dict = field(
+        default_factory=lambda: {
+            "type": "object",
+            "properties": {
+                "stream": {
+                    "type": "string",
+                    "description": "Which output to read: stdout (default), stderr or result.",
+                },
+                "execution_id": {
+                    "type": "string",
+                    "description": "Execution ID from the truncation notice. Defaults to the latest execution.",
+                },
+                "offset": {
+                    "type": "number",
+                    "description": "Character offset to start reading from.",
+                },
+                "length": {
+                    "type": "number",
+                    "description": "Number of characters to read. Defaults to the output length limit.",
+                },
+                "start_line": {
+                    "type": "number",
+                    "description": "1-based first line to return. Use with end_line for a line range.",
+                },
+                "end_line": {
+                    "type": "number",
+                    "description": "1-based last line to return (inclusive).",
+                },
+                "pattern": {
+                    "type": "string",
+                    "description": (
+                        f"Literal text (not a regex, up to {MAX_OUTPUT_PATTERN_LENGTH} characters); "
+                        "returns lines containing it with their line numbers."
+                    ),
+                },
+            },
+        }
+    )
+
+    async def run(
+        self,
+        event: AstrMessageEvent,
+        stream: str = "stdout",
+        execution_id: str = "",
+        offset: int = 0,
+        length: int = 0,
+        start_line: int = 0,
+        end_line: int = 0,
+        pattern: str = "",
+    ):
+        return await self.plugin.read_execution_output(
+            event,
+            stream=stream,
+            execution_id=execution_id,
+            offset=offset,
+            length=length,
+            start_line=start_line,
+            end_line=end_line,
+            pattern=pattern,
+        )
+
+
+@dataclass
+class SubmitJobTool(FunctionTool):
+    plugin: Any = field(repr=False, default=None)
+    name: str = "e2b_sandbox_submit_job"
+    description: str = (
+        "Start long-running Python code (training, scraping, batch processing) as a background job in the "
+        "session sandbox and return a job ID immediately. The user is notified when the job finishes. "
+        "The job runs as a separate `python3 -u job.py` process: it shares the sandbox filesystem but cannot see "
+        "variables or imports from e2b_sandbox_run_python_code, so the script must be self-contained."
+    )
+    parameters: dict = field(
+        default_factory=lambda: {
+            "type": "object",
+            "properties": {
+                "code": {
+                    "type": "string",
+                    "description": "Python script to run. Print progress; output is collected incrementally.",
+                },
+                "template": {
+                    "type": "string",
+                    "description": "Optional E2B template ID. Only used when a new sandbox must be created.",
+                },
+            },
+            "required": ["code"],
+        }
+    )
+
+    async def run(self, event: AstrMessageEvent, code: str = "", template: str = ""):
+        return await self.plugin.submit_job(event, code=code, template=template)
+
+
+@dataclass
+class JobStatusTool(FunctionTool):
+    plugin: Any = field(repr=False, default=None)
+    name: str = "e2b_sandbox_job_status"
+    description: str = (
+        "Check a background job's state and read the output it produced since the last check. "
+        "Without job_id, reports the latest job and lists the others in this session."
+    )
+    parameters: dict = field(
+        default_factory=lambda: {
+            "type": "object",
+            "properties": {
+                "job_id": {
+                    "type": "string",
+                    "description": "Job ID returned by e2b_sandbox_submit_job.",
+                },
+            },
+        }
+    )
+
+    async def run(self, event: AstrMessageEvent, job_id: str = ""):
+        return await self.plugin.get_job_status(event, job_id=job_id)
+
+
+@dataclass
+class CancelJobTool(FunctionTool):
+    plugin: Any = field(repr=False, default=None)
+    name: str = "e2b_sandbox_job_cancel"
+    description: str = "Stop a running background job. Without job_id, cancels the latest running job."
+    parameters: dict = field(
+        default_factory=lambda: {
+            "type": "object",
+            "properties": {
+                "job_id": {
+                    "type": "string",
+                    "description": "Job ID returned by e2b_sandbox_submit_job.",
+                },
+            },
+        }
+    )
+
+    async def run(self, event: AstrMessageEvent, job_id: str = ""):
+        return await self.plugin.cancel_job(event, job_id=job_id)
+
+
+class SandboxHandleCache:
+    """LRU cache of connected sandbox handles keyed by sandbox ID."""
+
+    def __init__(self, max_size: int = MAX_SANDBOX_HANDLE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def get(self, sandbox_id: str):
+        entry = self._entries.get(sandbox_id)
+        if entry is None:
+            return None
+        if entry["expires_at"] <= time.time():
+            self._entries.pop(sandbox_id, None)
+            return None
+        self._entries.move_to_end(sandbox_id)
+        return entry
+
+    def put(self, sandbox_id: str, sandbox, timeout: int):
+        now = time.time()
+        self._entries[sandbox_id] = {
+            "sandbox": sandbox,
+            "expires_at": now + timeout,
+            "validated_at": now,
+        }
+        self._entries.move_to_end(sandbox_id)
+        while len(self._entries) > self.max_size:
+            evicted_id, _ = self._entries.popitem(last=False)
+            logger.debug(f"[E2B] Evicted cached sandbox handle {evicted_id}")
+
+    def invalidate(self, sandbox_id: str):
+        self._entries.pop(str(sandbox_id or ""), None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class UploadBudget:
+    """Byte allowance shared by the concurrent attachment uploads of one execution.
+
+    Transfers charge bytes as they arrive, so parallel downloads stop as soon as
+    the combined total crosses the limit.
+    """
+
+    def __init__(self, limit_bytes: int):
+        self.limit = limit_bytes
+        self.used = 0
+
+    @property
+    def remaining(self):
+        return max(0, self.limit - self.used)
+
+    def charge(self, size: int):
+        if self.used + size > self.limit:
+            return False
+        self.used += size
+        return True
+
+    def refund(self, size: int):
+        self.used = max(0, self.used - size)
+
+
+class LatencyRecorder:
+    """Rolling per-template, per-phase latency samples for run_python_code."""
+
+    def __init__(self, max_samples: int = LATENCY_SAMPLE_WINDOW):
+        self.max_samples = max_samples
+        self._series = {}
+
+    def record(self, template: str, spans: dict):
+        for phase, seconds in spans.items():
+            series = self._series.get((template, phase))
+            if series is None:
+                series = {"samples": deque(maxlen=self.max_samples), "count": 0, "sum": 0.0}
+                self._series[(template, phase)] = series
+            series["samples"].append(seconds)
+            series["count"] += 1
+            series["sum"] += seconds
+
+    def quantiles(self, template: str, phase: str):
+        series = self._series.get((template, phase))
+        if not series or not series["samples"]:
+            return {}
+        samples = sorted(series["samples"])
+        return {
+            quantile: samples[min(len(samples) - 1, max(0, int(quantile * len(samples) + 0.5) - 1))]
+            for quantile in LATENCY_QUANTILES
+        }
+
+    def templates(self):
+        return sorted({template for template, _ in self._series})
+
+    def phases(self, template: str):
+        recorded = {phase for series_template, phase in self._series if series_template == template}
+        return [phase for phase in LATENCY_PHASES if phase in recorded] + sorted(recorded - set(LATENCY_PHASES))
+
+    def count(self, template: str, phase: str):
+        series = self._series.get((template, phase))
+        return series["count"] if series else 0
+
+    def render_prometheus(self):
+        metric = "astrbot_e2b_phase_duration_seconds"
+        lines = [
+            f"# HELP {metric} Duration of run_python_code phases per sandbox template.",
+            f"# TYPE {metric} summary",
+        ]
+        for template in self.templates():
+            for phase in self.phases(template):
+                labels = f'template="{self._escape(template)}",phase="{phase}"'
+                for quantile, value in self.quantiles(template, phase).items():
+                    lines.append(f'{metric}{{{labels},quantile="{quantile}"}} {value:.6f}')
+                series = self._series[(template, phase)]
+                lines.append(f"{metric}_sum{{{labels}}} {series['sum']:.6f}")
+                lines.append(f"{metric}_count{{{labels}}} {series['count']}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _escape(value: str):
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class ImageDispatcher:
+    """Sends display images in order while an execution is still streaming results."""
+
+    def __init__(self, plugin, event, session_id: str, limit: int):
+        self.plugin = plugin
+        self.event = event
+        self.session_id = session_id
+        self.limit = limit
+        self.max_dimension, self.max_bytes = plugin._get_image_limits()
+        self.sent = 0
+        self.skipped = 0
+        self.timed_out = 0
+        self._sending = False
+        self._seen_results = set()
+        self._queue = deque()
+        self._worker = None
+
+    def submit(self, result):
+        if id(result) in self._seen_results:
+            return
+        self._seen_results.add(id(result))
+        img_data, img_ext = self.plugin._extract_image_data(result)
+        if not img_data:
+            return
+        if not self.limit or len(self._queue) >= MAX_CAPTURED_RESULTS:
+            self.skipped += 1
+            return
+
+        self._queue.append((img_data, img_ext))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._drain())
+            self.plugin._image_tasks.add(self._worker)
+            self._worker.add_done_callback(self.plugin._image_tasks.discard)
+
+    async def _drain(self):
+        while self._queue:
+            img_data, img_ext = self._queue.popleft()
+            if self.sent >= self.limit:
+                self.skipped += 1
+                continue
+            self._sending = True
+            try:
+                await self._send(img_data, img_ext)
+            finally:
+                self._sending = False
+
+    async def _send(self, img_data, img_ext: str):
+        tmp_path = None
+        loop = asyncio.get_running_loop()
+        executor = self.plugin._image_executor
+        try:
+            img_bytes, digest = await loop.run_in_executor(executor, self.plugin._decode_image, img_data)
+            sent_hashes = self.plugin.sent_image_hashes[self.session_id]
+            if digest in sent_hashes:
+                return
+            tmp_path = await loop.run_in_executor(
+                executor,
+                self.plugin._render_image_file,
+                img_bytes,
+                img_ext,
+                self.max_dimension,
+                self.max_bytes,
+            )
+            await self.event.send(self.event.chain_result([Image.fromFileSystem(tmp_path)]))
+            sent_hashes.add(digest)
+            self.sent += 1
+            logger.info("[E2B] Image sent successfully.")
+        except Exception as exc:
+            logger.error(f"[E2B] Image send failed: {exc}")
+        finally:
+            if tmp_path:
+                await asyncio.to_thread(self.plugin._remove_file_quietly, tmp_path)
+
+    async def finish(self, timeout: float):
+        if self._worker is None:
+            return self.sent
+        await asyncio.wait([self._worker], timeout=timeout)
+        if not self._worker.done():
+            # Stop here so the reported count is final; whatever is still queued
+            # or mid-send is reported as timed out rather than silently sent later.
+            self.timed_out = len(self._queue) + int(self._sending)
+            self._queue.clear()
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+        return self.sent
+
+
+class OutputSpool:
+    """Gzip-compressed, size-capped copy of one execution's output streams.
+
+    write() runs inside SDK output callbacks on the event loop, so it only
+    buffers; the buffered text is compressed to disk on a worker thread, one
+    flush at a time. Await wait_flushed() before calling close().
+    """
+
+    def __init__(self, directory: Path, max_chars: int = MAX_OUTPUT_SPOOL_CHARS):
+        self.directory = directory
+        self.max_chars = max_chars
+        self.sizes = {}
+        self.truncated = set()
+        self._files = {}
+        self._pending = defaultdict(list)
+        self._pending_chars = 0
+        self._flush = None
+
+    def write(self, stream: str, text: str):
+        if not text:
+            return
+        size = self.sizes.get(stream, 0)
+        if size + len(text) > self.max_chars:
+            self.truncated.add(stream)
+            text = text[: max(0, self.max_chars - size)]
+            if not text:
+                return
+
+        self._pending[stream].append(text)
+        self._pending_chars += len(text)
+        self.sizes[stream] = size + len(text)
+        if self._pending_chars >= OUTPUT_SPOOL_FLUSH_CHARS and self._flush is None:
+            self._start_flush()
+
+    async def wait_flushed(self):
+        while self._flush is not None:
+            await asyncio.wait([self._flush])
+
+    def close(self):
+        self._write_pending(self._take_pending())
+        for file_obj in self._files.values():
+            file_obj.close()
+        self._files.clear()
+        if self.sizes:
+            (self.directory / "meta.json").write_text(
+                json.dumps({"sizes": self.sizes, "truncated": sorted(self.truncated)}),
+                encoding="utf-8",
+            )
+
+    def _take_pending(self):
+        pending = {stream: "".join(chunks) for stream, chunks in self._pending.items()}
+        self._pending.clear()
+        self._pending_chars = 0
+        return pending
+
+    def _start_flush(self):
+        self._flush = asyncio.get_running_loop().run_in_executor(
+            None, self._write_pending, self._take_pending()
+        )
+        self._flush.add_done_callback(self._on_flush_done)
+
+    def _on_flush_done(self, future):
+        self._flush = None
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"[E2B] Failed to spool execution output: {future.exception()}")
+        if self._pending_chars >= OUTPUT_SPOOL_FLUSH_CHARS:
+            self._start_flush()
+
+    def _write_pending(self, pending: dict):
+        for stream, text in pending.items():
+            file_obj = self._files.get(stream)
+            if file_obj is None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                file_obj = gzip.open(self.directory / f"{stream}.txt.gz", "wt", encoding="utf-8", compresslevel=1)
+                self._files[stream] = file_obj
+            file_obj.write(text)
+
+
+class OutputCapture:
+    """Keeps the first and last characters of a text stream within a fixed budget.
+
+    Everything in between is dropped as it arrives; only the dropped character and
+    line counts are kept. This bounds what the plugin holds and returns to the LLM,
+    not peak memory: the e2b SDK still appends every chunk to its own Execution
+    object until run_code returns.
+    """
+
+    def __init__(self, head_limit: int, tail_limit: int, spool: OutputSpool = None, stream: str = ""):
+        self.head_limit = head_limit
+        self.tail_limit = tail_limit
+        self.spool = spool
+        self.stream = stream
+        self._head = []
+        self._head_size = 0
+        self._tail = deque()
+        self._tail_size = 0
+        self.dropped_chars = 0
+        self.dropped_lines = 0
+
+    def write(self, text: str):
+        if not text:
+            return
+        if self.spool is not None:
+            self.spool.write(self.stream, text)
+        if self._head_size < self.head_limit:
+            taken = text[: self.head_limit - self._head_size]
+            self._head.append(taken)
+            self._head_size += len(taken)
+            text = text[len(taken):]
+            if not text:
+                return
+
+        self._tail.append(text)
+        self._tail_size += len(text)
+        while self._tail_size > self.tail_limit:
+            excess = self._tail_size - self.tail_limit
+            first = self._tail[0]
+            if len(first) <= excess:
+                self._tail.popleft()
+                dropped = first
+            else:
+                self._tail[0] = first[excess:]
+                dropped = first[:excess]
+            self._tail_size -= len(dropped)
+            self.dropped_chars += len(dropped)
+            self.dropped_lines += dropped.count("\n")
+
+    @property
+    def total_chars(self):
+        return self._head_size + self._tail_size + self.dropped_chars
+
+    def getvalue(self):
+        head = "".join(self._head)
+        tail = "".join(self._tail)
+        if not self.dropped_chars:
+            return (head + tail).strip()
+        return (
+            f"{head}\n...[{self.dropped_lines} lines / {self.dropped_chars} characters omitted]...\n{tail}"
+        ).strip()
+
+    def render(self, budget: int):
+        """Returns the stream cut to about ``budget`` characters at line boundaries, and whether it was cut."""
+        head = "".join(self._head)
+        tail = "".join(self._tail)
+        if not self.dropped_chars:
+            if len(head) + len(tail) <= budget:
+                return (head + tail).strip(), False
+            # Nothing was dropped yet, so head and tail are one contiguous text.
+            head = tail = head + tail
+
+        content = max(0, budget - OUTPUT_MARKER_RESERVE)
+        head_part = head[: min(len(head), content * 2 // 3)]
+        newline = head_part.rfind("\n")
+        if newline > 0:
+            head_part = head_part[: newline + 1]
+        tail_len = min(len(tail), content - len(head_part))
+        tail_part = tail[len(tail) - tail_len:] if tail_len > 0 else ""
+        newline = tail_part.find("\n")
+        if 0 <= newline < len(tail_part) - 1:
+            tail_part = tail_part[newline + 1:]
+
+        if self.dropped_chars:
+            omitted = head[len(head_part):] + tail[: len(tail) - len(tail_part)]
+        else:
+            omitted = head[len(head_part): len(head) - len(tail_part)]
+        omitted_chars = self.dropped_chars + len(omitted)
+        omitted_lines = self.dropped_lines + omitted.count("\n")
+        return (
+            f"{head_part.rstrip()}\n...[{omitted_lines} lines / {omitted_chars} characters omitted]...\n"
+            f"{tail_part.lstrip()}"
+        ).strip(), True
+
+
+class LoopLagWatchdog:
+    """Detects event-loop stalls from a helper thread and records the blocking stack.
+
+    A heartbeat coroutine stamps the loop every few milliseconds. The watchdog
+    thread checks the stamp; once it is older than the threshold, it captures the
+    loop thread's current stack into a rotating diagnostics log.
+    """
+
+    def __init__(self, threshold_seconds: float, log_path: Path):
+        self.threshold = threshold_seconds
+        self.interval = min(0.1, threshold_seconds / 4)
+        self.stalls = 0
+        self.max_lag = 0.0
+        self._last_beat = time.monotonic()
+        self._reported_beat = None
+        self._loop_thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._heartbeat_task = None
+        self._diagnostics = logging.getLogger(f"{PLUGIN_NAME}.watchdog")
+        self._diagnostics.propagate = False
+        self._diagnostics.setLevel(logging.INFO)
+        self._handler = logging.handlers.RotatingFileHandler(
+            log_path,
+            maxBytes=DIAGNOSTICS_LOG_MAX_BYTES,
+            backupCount=DIAGNOSTICS_LOG_BACKUP_COUNT,
+            encoding="utf-8",
+            delay=True,
+        )
+        self._handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        self._diagnostics.addHandler(self._handler)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._heartbeat_task = loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="e2b-loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def cancel_heartbeat(self):
+        """Must be called on the loop thread; Task.cancel is not thread-safe."""
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        self._diagnostics.removeHandler(self._handler)
+        self._handler.close()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self._diagnostics.warning(f"Event loop stall ended after {lag * 1000:.0f}ms")
+            self._last_beat = now
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            last_beat = self._last_beat
+            stalled_for = time.monotonic() - last_beat
+            if stalled_for < self.threshold or self._reported_beat == last_beat:
+                continue
+            self._reported_beat = last_beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(stack unavailable)\n"
+            self._diagnostics.warning(
+                f"Event loop blocked for {stalled_for * 1000:.0f}ms (threshold {self.threshold * 1000:.0f}ms); "
+                f"loop thread stack:\n{stack}"
+            )
+            logger.warning(
+                f"[E2B] Event loop blocked for {stalled_for * 1000:.0f}ms; stack written to diagnostics log"
+            )
+
+    def render_prometheus(self):
+        return (
+            "# HELP astrbot_e2b_event_loop_lag_max_seconds Largest observed event loop lag.\n"
+            "# TYPE astrbot_e2b_event_loop_lag_max_seconds gauge\n"
+            f"astrbot_e2b_event_loop_lag_max_seconds {self.max_lag:.6f}\n"
+            "# HELP astrbot_e2b_event_loop_stalls_total Event loop stalls longer than the watchdog threshold.\n"
+            "# TYPE astrbot_e2b_event_loop_stalls_total counter\n"
+            f"astrbot_e2b_event_loop_stalls_total {self.stalls}\n"
+        )
+
+
+class SandboxSessionStore:
+    """SQLite (WAL) persistence for sandbox sessions, the warm pool and background jobs.
+
+    All statements run on a single worker thread, so writes are applied in
+    submission order without blocking the event loop.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="e2b-session-store")
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, sandbox_id TEXT NOT NULL, template TEXT NOT NULL DEFAULT '', "
+                "status TEXT NOT NULL DEFAULT '', last_active REAL NOT NULL DEFAULT 0, data TEXT NOT NULL DEFAULT '{}')"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions (last_active)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS warm_pool ("
+                "sandbox_id TEXT PRIMARY KEY, template TEXT NOT NULL DEFAULT '', created_at REAL NOT NULL DEFAULT 0)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, session_id TEXT NOT NULL, status TEXT NOT NULL DEFAULT '', "
+                "created_at REAL NOT NULL DEFAULT 0, data TEXT NOT NULL DEFAULT '{}')"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _call(self, func, *args):
+        return self._executor.submit(func, *args).result()
+
+    def _submit(self, func, *args):
+        try:
+            future = self._executor.submit(func, *args)
+        except RuntimeError as exc:
+            logger.warning(f"[E2B] Session store is closed, dropping write: {exc}")
+            return
+        future.add_done_callback(self._log_failure)
+
+    def _log_failure(self, future):
+        exc = future.exception()
+        if exc is not None:
+            logger.warning(f"[E2B] Failed to persist sandbox state: {exc}")
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def load_sessions(self):
+        return self._call(self._load_sessions)
+
+    def _load_sessions(self):
+        sessions = {}
+        rows = self._connection().execute(
+            "SELECT session_id, sandbox_id, template, status, last_active, data FROM sessions"
+        )
+        for session_id, sandbox_id, template, status, last_active, data in rows:
+            try:
+                extra = json.loads(data or "{}")
+            except ValueError:
+                extra = {}
+            meta = extra if isinstance(extra, dict) else {}
+            meta.update(
+                sandbox_id=sandbox_id,
+                template=template,
+                status=status,
+                last_active=last_active,
+            )
+            sessions[session_id] = meta
+        return sessions
+
+    def upsert_session(self, session_id: str, sandbox_meta: dict):
+        self._submit(self._upsert_session, session_id, dict(sandbox_meta))
+
+    def upsert_sessions(self, sessions: dict):
+        for session_id, sandbox_meta in sessions.items():
+            self.upsert_session(session_id, sandbox_meta)
+
+    def _upsert_session(self, session_id: str, sandbox_meta: dict):
+        extra = {
+            key: value
+            for key, value in sandbox_meta.items()
+            if key not in ("sandbox_id", "template", "status", "last_active")
+        }
+        conn = self._connection()
+        conn.execute(
+            "INSERT INTO sessions (session_id, sandbox_id, template, status, last_active, data) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(session_id) DO UPDATE SET "
+            "sandbox_id = excluded.sandbox_id, template = excluded.template, status = excluded.status, "
+            "last_active = excluded.last_active, data = excluded.data",
+            (
+                session_id,
+                str(sandbox_meta.get("sandbox_id") or ""),
+                str(sandbox_meta.get("template") or ""),
+                str(sandbox_meta.get("status") or ""),
+                float(sandbox_meta.get("last_active", 0) or 0),
+                json.dumps(extra, ensure_ascii=False),
+            ),
+        )
+        conn.commit()
+
+    def delete_session(self, session_id: str):
+        self._submit(self._delete_session, session_id)
+
+    def _delete_session(self, session_id: str):
+        conn = self._connection()
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        conn.commit()
+
+    async def expired_session_ids(self, cutoff: float):
+        return await self._run(self._expired_session_ids, cutoff)
+
+    def _expired_session_ids(self, cutoff: float):
+        rows = self._connection().execute(
+            "SELECT session_id FROM sessions WHERE last_active < ? ORDER BY last_active",
+            (cutoff,),
+        )
+        return [row[0] for row in rows]
+
+    def load_warm_pool(self):
+        return self._call(self._load_warm_pool)
+
+    def _load_warm_pool(self):
+        pool = defaultdict(list)
+        rows = self._connection().execute(
+            "SELECT sandbox_id, template, created_at FROM warm_pool ORDER BY created_at"
+        )
+        for sandbox_id, template, created_at in rows:
+            pool[template].append({"sandbox_id": sandbox_id, "created_at": created_at})
+        return pool
+
+    def replace_warm_pool(self, pool: dict):
+        rows = [
+            (member["sandbox_id"], template, float(member.get("created_at", 0) or 0))
+            for template, members in pool.items()
+            for member in members
+        ]
+        self._submit(self._replace_warm_pool, rows)
+
+    def _replace_warm_pool(self, rows):
+        conn = self._connection()
+        conn.execute("DELETE FROM warm_pool")
+        conn.executemany("INSERT OR REPLACE INTO warm_pool (sandbox_id, template, created_at) VALUES (?, ?, ?)", rows)
+        conn.commit()
+
+    def load_jobs(self):
+        return self._call(self._load_jobs)
+
+    def _load_jobs(self):
+        jobs = {}
+        rows = self._connection().execute("SELECT job_id, data FROM jobs ORDER BY created_at")
+        for job_id, data in rows:
+            try:
+                job = json.loads(data or "{}")
+            except ValueError:
+                continue
+            if isinstance(job, dict):
+                jobs[job_id] = job
+        return jobs
+
+    def upsert_job(self, job: dict):
+        self._submit(self._upsert_job, dict(job))
+
+    def _upsert_job(self, job: dict):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO jobs (job_id, session_id, status, created_at, data) VALUES (?, ?, ?, ?, ?)",
+            (
+                job["job_id"],
+                job["session_id"],
+                job["status"],
+                float(job.get("created_at", 0) or 0),
+                json.dumps(job, ensure_ascii=False),
+            ),
+        )
+        conn.commit()
+
+    def delete_jobs(self, job_ids):
+        self._submit(self._delete_jobs, [(job_id,) for job_id in job_ids])
+
+    def _delete_jobs(self, rows):
+        conn = self._connection()
+        conn.executemany("DELETE FROM jobs WHERE job_id = ?", rows)
+        conn.commit()
+
+    def close(self):
+        try:
+            self._executor.submit(self._close).result()
+        except RuntimeError:
+            pass
+        self._executor.shutdown(wait=True)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
 class Main(star.Star):
     """Use E2B cloud sandboxes to execute Python code safely."""
 
@@ -284,13 +1476,79 @@ class Main(star.Star):
         self.session_files = defaultdict(list)
         self.generated_files = defaultdict(list)
         self.sent_file_signatures = defaultdict(set)
+        self.sent_image_hashes = defaultdict(set)
         self.session_last_access = {}
         self.session_locks = {}
         self.sandbox_sessions = {}
         self._plugin_data_dir = self._get_plugin_data_dir()
         self._sandbox_state_path = self._plugin_data_dir / "sandbox_sessions.json"
+        self._store = SandboxSessionStore(self._plugin_data_dir / "sandbox_state.db")
+        self.warm_pool = defaultdict(list)
+        self._warm_pool_path = self._plugin_data_dir / "warm_pool.json"
+        self._warm_pool_templates = set()
+        self._warm_pool_locks = defaultdict(asyncio.Lock)
+        self._kill_tasks = set()
+        self._metrics_tasks = set()
+        self._warm_pool_wakeup = None
+        self._warm_pool_task = None
+        self._sandbox_handles = SandboxHandleCache()
+        self._idle_pause_tasks = {}
+        self._helper_snapshot_ids = {}
+        self._plot_font_warned = False
+        self._svg_warned = False
+        self._expiry_heap = []
+        self._expiry_scheduled = set()
+        self._reaper_wakeup = None
+        self._reaper_task = None
+        self._http_clients = {}
+        self._download_semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+        self._bot_api_callers = {}
+        self._file_url_cache = OrderedDict()
+        self._prewarm_tasks = {}
+        self._image_tasks = set()
+        self._image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKER_COUNT, thread_name_prefix="e2b-image")
+        self._latency = LatencyRecorder()
+        self._metrics_path = self._plugin_data_dir / "metrics.prom"
+        self._metrics_flushed_at = 0.0
+        self._loop_watchdog = None
+        self.jobs = {}
+        self._job_monitor_task = None
         self._load_sandbox_sessions()
+        self._load_jobs()
+        self._load_warm_pool()
         self._register_llm_tools()
+        self._ensure_background_tasks()
+
+    async def terminate(self):
+        for task in (
+            self._warm_pool_task,
+            self._reaper_task,
+            self._job_monitor_task,
+            *self._prewarm_tasks.values(),
+        ):
+            if task is not None:
+                task.cancel()
+        self._prewarm_tasks.clear()
+        self._warm_pool_task = None
+        self._reaper_task = None
+        self._job_monitor_task = None
+        self._save_warm_pool()
+        if self._kill_tasks:
+            await asyncio.gather(*self._kill_tasks, return_exceptions=True)
+        await self._flush_idle_pauses()
+        self._sandbox_handles.clear()
+        if self._metrics_tasks:
+            await asyncio.gather(*self._metrics_tasks, return_exceptions=True)
+        await self._flush_metrics(force=True)
+        if self._loop_watchdog is not None:
+            self._loop_watchdog.cancel_heartbeat()
+            await asyncio.to_thread(self._loop_watchdog.stop)
+            self._loop_watchdog = None
+        for client in self._http_clients.values():
+            await client.aclose()
+        self._http_clients.clear()
+        self._image_executor.shutdown(wait=False, cancel_futures=True)
+        await asyncio.to_thread(self._store.close)
 
     def _register_llm_tools(self):
         tools = [
@@ -302,6 +1560,10 @@ class Main(star.Star):
             SandboxStatusTool(plugin=self),
             ListFilesTool(plugin=self),
             SendFileTool(plugin=self),
+            ReadOutputTool(plugin=self),
+            SubmitJobTool(plugin=self),
+            JobStatusTool(plugin=self),
+            CancelJobTool(plugin=self),
         ]
         add_tools = getattr(self.context, "add_llm_tools", None)
         if add_tools is None:
@@ -313,20 +1575,20 @@ class Main(star.Star):
         if not self._is_user_allowed(event):
             return
 
-        await self._cleanup_expired_sessions()
         self._mark_session_active(event)
         files = self._extract_event_files(event)
-        if not files:
-            return
+        if files:
+            files = await self._hydrate_component_files(event, files)
 
-        files = await self._hydrate_component_files(event, files)
+            session_id = self._get_session_id(event)
+            self.session_files[session_id] = files[-MAX_SESSION_FILE_COUNT:]
+            logger.info(
+                f"[E2B] Cached {len(self.session_files[session_id])} file(s) for session {session_id}"
+            )
+            logger.info(f"[E2B] Cached file metadata: {self.session_files[session_id]}")
 
-        session_id = self._get_session_id(event)
-        self.session_files[session_id] = files[-MAX_SESSION_FILE_COUNT:]
-        logger.info(
-            f"[E2B] Cached {len(self.session_files[session_id])} file(s) for session {session_id}"
-        )
-        logger.info(f"[E2B] Cached file metadata: {self.session_files[session_id]}")
+        if self.config.get("speculative_prewarm", False):
+            self._schedule_speculative_prewarm(event)
 
     async def run_python_code(
         self,
@@ -360,7 +1622,6 @@ class Main(star.Star):
         code_to_run = match.group(1).strip() if match else code.strip()
 
         session_id = self._get_session_id(event)
-        await self._cleanup_expired_sessions()
         self._mark_session_active(event)
         pending_files = self._get_pending_files(event)
         hash_source = json.dumps(
@@ -390,27 +1651,39 @@ class Main(star.Star):
             minimum=200,
             maximum=MAX_RESULT_LIMIT,
         )
-        sandbox_lifespan = max(exec_timeout + 30, DEFAULT_SANDBOX_TIMEOUT)
+        sandbox_lifespan = self._get_sandbox_lifespan(exec_timeout)
 
         sandbox = None
         llm_feedback = []
-        streamed_stdout = []
-        streamed_stderr = []
+        execution_id = uuid.uuid4().hex[:8]
+        spool = OutputSpool(self._get_output_spool_dir(session_id) / execution_id)
+        stdout_capture = self._new_output_capture(output_limit, spool, "stdout")
+        stderr_capture = self._new_output_capture(output_limit, spool, "stderr")
         streamed_results = []
+        dropped_results = 0
+        image_dispatcher = ImageDispatcher(self, event, session_id, self._get_max_images_per_execution())
         before_snapshot = {}
+        spans = {}
+        started_at = time.perf_counter()
 
+        self._cancel_idle_pause(session_id)
         async with self._get_session_lock(session_id):
+            spans["lock_wait"] = time.perf_counter() - started_at
             try:
-                sandbox, sandbox_meta, sandbox_notice = await self._get_or_create_session_sandbox(
-                    event=event,
-                    template=template,
-                    timeout=sandbox_lifespan,
-                    create_if_missing=True,
-                )
+                with self._time_phase(spans, "sandbox"):
+                    sandbox, sandbox_meta, sandbox_notice = await self._get_or_create_session_sandbox(
+                        event=event,
+                        template=template,
+                        timeout=sandbox_lifespan,
+                        create_if_missing=True,
+                    )
                 if sandbox_notice:
                     llm_feedback.append(f"[System Notification] {sandbox_notice}")
 
-                uploaded_paths = await self._stage_pending_files(event, sandbox, pending_files)
+                with self._time_phase(spans, "stage"):
+                    uploaded_paths = await self._stage_pending_files(
+                        event, session_id, sandbox, pending_files
+                    )
                 if uploaded_paths:
                     llm_feedback.append(
                         "[System Notification] Uploaded files: " + ", ".join(uploaded_paths)
@@ -418,66 +1691,105 @@ class Main(star.Star):
 
                 packages = self._detect_packages(code_to_run)
                 if packages:
-                    await self._install_dependencies(sandbox, packages)
+                    with self._time_phase(spans, "install"):
+                        await self._install_dependencies(session_id, sandbox, packages)
 
-                before_snapshot = await self._snapshot_sandbox_files(sandbox)
-                full_code = self._build_execution_code(code_to_run)
+                with self._time_phase(spans, "snapshot"):
+                    before_snapshot = await self._snapshot_sandbox_files(sandbox)
+                plot_setup = self._needs_plot_setup(session_id, code_to_run, packages)
+                if plot_setup:
+                    with self._time_phase(spans, "install"):
+                        await self._upload_plot_font(sandbox)
+                full_code = self._build_execution_code(code_to_run, plot_setup=plot_setup)
 
                 logger.info("[E2B] Running user code...")
-                execution = await asyncio.wait_for(
-                    sandbox.run_code(
-                        full_code,
-                        on_stdout=lambda msg: streamed_stdout.append(self._stringify_output(msg)),
-                        on_stderr=lambda msg: streamed_stderr.append(self._stringify_output(msg)),
-                        on_result=lambda result: streamed_results.append(result),
-                        timeout=exec_timeout,
-                    ),
-                    timeout=exec_timeout + 5,
-                )
+                with self._time_phase(spans, "execute"):
+                    def capture_result(result):
+                        nonlocal dropped_results
+                        image_dispatcher.submit(result)
+                        if len(streamed_results) < MAX_CAPTURED_RESULTS:
+                            streamed_results.append(result)
+                        else:
+                            dropped_results += 1
+
+                    execution = await asyncio.wait_for(
+                        sandbox.run_code(
+                            full_code,
+                            on_stdout=lambda msg: stdout_capture.write(self._stringify_output(msg)),
+                            on_stderr=lambda msg: stderr_capture.write(self._stringify_output(msg)),
+                            on_result=capture_result,
+                            timeout=exec_timeout,
+                        ),
+                        timeout=exec_timeout + 5,
+                    )
                 logger.info("[E2B] Execution finished.")
 
-                stdout_text = self._merge_chunks(streamed_stdout)
-                stderr_text = self._merge_chunks(streamed_stderr)
-
                 if hasattr(execution, "logs"):
-                    if not stdout_text and getattr(execution.logs, "stdout", None):
-                        stdout_text = "".join(execution.logs.stdout)
-                    if not stderr_text and getattr(execution.logs, "stderr", None):
-                        stderr_text = "".join(execution.logs.stderr)
-
-                if stdout_text:
-                    llm_feedback.append(f"STDOUT:\n{stdout_text}")
-                if stderr_text:
-                    llm_feedback.append(f"STDERR:\n{stderr_text}")
-
-                text_result = self._extract_text_result(execution, streamed_results)
-                if text_result:
-                    llm_feedback.append(f"RESULT:\n{text_result}")
+                    for capture, chunks in (
+                        (stdout_capture, getattr(execution.logs, "stdout", None)),
+                        (stderr_capture, getattr(execution.logs, "stderr", None)),
+                    ):
+                        if not capture.getvalue() and chunks:
+                            for chunk in chunks:
+                                capture.write(self._stringify_output(chunk))
+                        if isinstance(chunks, list):
+                            # Drop the SDK's full copy so it is not kept alive through the image and file phases.
+                            chunks.clear()
+                stdout_text = stdout_capture.getvalue()
+                stderr_text = stderr_capture.getvalue()
+                result_capture = self._extract_text_result(execution, streamed_results, output_limit, spool)
+                text_result = result_capture.getvalue()
+                # Filled in once every other part is known, so the streams share what is left of the limit.
+                output_slot = len(llm_feedback)
+                llm_feedback.append("")
+                if dropped_results:
+                    llm_feedback.append(
+                        f"[System Notification] {dropped_results} additional display result(s) were omitted."
+                    )
 
                 execution_error = getattr(execution, "error", None)
                 if execution_error:
                     llm_feedback.append(
                         f"EXECUTION ERROR:\n{self._stringify_output(execution_error)}"
                     )
+                if plot_setup and getattr(execution_error, "name", "") not in ("SyntaxError", "IndentationError"):
+                    sandbox_meta["plot_ready"] = True
 
-                has_sent_image = await self._handle_images(event, execution, streamed_results)
-                if has_sent_image:
+                with self._time_phase(spans, "images"):
+                    sent_images = await self._handle_images(image_dispatcher, execution)
+                if sent_images:
+                    llm_feedback.append(
+                        f"[System Notification] {sent_images} image(s) generated successfully and sent to user interface."
+                    )
+                if image_dispatcher.skipped and not image_dispatcher.limit:
                     llm_feedback.append(
-                        "[System Notification] Image generated successfully and sent to user interface."
+                        f"[System Notification] {image_dispatcher.skipped} image(s) were not sent "
+                        "because image sending is disabled."
+                    )
+                elif image_dispatcher.skipped:
+                    llm_feedback.append(
+                        f"[System Notification] {image_dispatcher.skipped} additional image(s) were not sent "
+                        "because of the per-execution image limit."
+                    )
+                if image_dispatcher.timed_out:
+                    llm_feedback.append(
+                        f"[System Notification] {image_dispatcher.timed_out} image(s) were not sent "
+                        f"because sending took longer than {IMAGE_DISPATCH_WAIT_SECONDS}s."
                     )
 
-                sent_files = await self._handle_generated_files(
-                    event,
-                    sandbox,
-                    pending_files,
-                    [
-                        stdout_text,
-                        stderr_text,
-                        text_result,
-                        self._stringify_output(execution_error),
-                    ],
-                    before_snapshot,
-                )
+                with self._time_phase(spans, "files"):
+                    sent_files = await self._handle_generated_files(
+                        event,
+                        sandbox,
+                        pending_files,
+                        [
+                            stdout_text,
+                            stderr_text,
+                            text_result,
+                            self._stringify_output(execution_error),
+                        ],
+                        before_snapshot,
+                    )
                 if sent_files:
                     llm_feedback.append(
                         "[System Notification] Generated files cached for manual delivery: "
@@ -493,19 +1805,27 @@ class Main(star.Star):
 
                 pause_summary = "Sandbox kept running."
                 if auto_pause:
-                    pause_method = await self._pause_sandbox(sandbox)
-                    self._update_sandbox_session(
-                        session_id,
-                        sandbox_meta["sandbox_id"],
-                        template=sandbox_meta.get("template", ""),
-                        status="paused",
-                    )
-                    pause_summary = f"Sandbox auto-paused with {pause_method}."
+                    with self._time_phase(spans, "release"):
+                        pause_summary = await self._release_sandbox(session_id, sandbox, sandbox_meta)
 
+                output_budget = output_limit - sum(len(part) + 2 for part in llm_feedback if part)
+                llm_feedback[output_slot], output_truncated = self._render_output_sections(
+                    [("STDOUT", stdout_capture), ("STDERR", stderr_capture), ("RESULT", result_capture)],
+                    output_budget,
+                )
                 result_text = "\n\n".join(part for part in llm_feedback if part).strip()
                 if not result_text:
                     result_text = "Code executed successfully (no visible output)."
-                result_text = self._truncate(result_text, output_limit)
+                if not output_truncated and len(result_text) > output_limit:
+                    # Only notifications can overflow here; captured streams already fit their share.
+                    output_truncated = True
+                    result_text = self._truncate(result_text, output_limit)
+                if output_truncated and spool.sizes:
+                    result_text += (
+                        f"\n\n[System Notification] Output was truncated. The full output of execution "
+                        f"{execution_id} is saved; call e2b_sandbox_read_output with a line range, offset or "
+                        "pattern instead of re-running the code."
+                    )
 
                 return (
                     f"{result_text}\n\n"
@@ -524,12 +1844,24 @@ class Main(star.Star):
                 logger.warning(
                     "[E2B] Task cancelled by AstrBot Core. Sandbox kept for manual lifecycle control."
                 )
+                if sandbox is not None:
+                    self._helper_snapshot_ids.pop(self._extract_sandbox_id(sandbox), None)
                 raise
             except asyncio.TimeoutError:
+                if sandbox is not None:
+                    await self._discard_snapshot(sandbox)
                 return f"Error: Execution timed out (>{exec_timeout}s)."
             except Exception as exc:
                 logger.error(f"[E2B] Execution Exception: {traceback.format_exc()}")
+                if sandbox is not None:
+                    await self._discard_snapshot(sandbox)
+                    self._sandbox_handles.invalidate(self._extract_sandbox_id(sandbox))
                 return f"Runtime Error: {exc}"
+            finally:
+                spans["total"] = time.perf_counter() - started_at
+                self._record_latency(session_id, template, spans)
+                await spool.wait_flushed()
+                await asyncio.to_thread(self._finish_output_spool, spool)
 
     async def create_session_sandbox(self, event: AstrMessageEvent, template: str = ""):
         denied_message = self._get_user_access_denied_message(event)
@@ -537,9 +1869,9 @@ class Main(star.Star):
             return denied_message
 
         session_id = self._get_session_id(event)
-        await self._cleanup_expired_sessions()
         self._mark_session_active(event)
 
+        self._cancel_idle_pause(session_id)
         async with self._get_session_lock(session_id):
             _, sandbox_meta, notice = await self._get_or_create_session_sandbox(
                 event=event,
@@ -561,9 +1893,9 @@ class Main(star.Star):
             return denied_message
 
         session_id = self._get_session_id(event)
-        await self._cleanup_expired_sessions()
         self._mark_session_active(event)
 
+        self._cancel_idle_pause(session_id)
         async with self._get_session_lock(session_id):
             sandbox, sandbox_meta, notice = await self._get_or_create_session_sandbox(
                 event=event,
@@ -584,9 +1916,9 @@ class Main(star.Star):
             return denied_message
 
         session_id = self._get_session_id(event)
-        await self._cleanup_expired_sessions()
         self._mark_session_active(event)
 
+        self._cancel_idle_pause(session_id)
         async with self._get_session_lock(session_id):
             sandbox_meta = self.sandbox_sessions.get(session_id)
             if not sandbox_meta or not sandbox_meta.get("sandbox_id"):
@@ -605,11 +1937,18 @@ class Main(star.Star):
                 template=sandbox_meta.get("template", ""),
                 status="paused",
             )
-            return (
+            message = (
                 f"Sandbox paused with {pause_method}.\n"
                 f"Sandbox ID: {sandbox_meta['sandbox_id']}\n"
                 "State is preserved and can be resumed later."
             )
+            running_jobs = self._get_running_jobs(session_id)
+            if running_jobs:
+                message += (
+                    f"\n{len(running_jobs)} background job(s) are suspended until the sandbox is resumed: "
+                    + ", ".join(job["job_id"] for job in running_jobs)
+                )
+            return message
 
     async def kill_session_sandbox(self, event: AstrMessageEvent):
         denied_message = self._get_user_access_denied_message(event)
@@ -617,24 +1956,20 @@ class Main(star.Star):
             return denied_message
 
         session_id = self._get_session_id(event)
-        await self._cleanup_expired_sessions()
         self._mark_session_active(event)
 
+        self._cancel_idle_pause(session_id)
         async with self._get_session_lock(session_id):
             sandbox_meta = self.sandbox_sessions.get(session_id)
             if not sandbox_meta or not sandbox_meta.get("sandbox_id"):
                 return "No sandbox exists for this session."
 
-            try:
-                sandbox = await self._connect_to_existing_sandbox(
-                    sandbox_meta["sandbox_id"],
-                    timeout=DEFAULT_SANDBOX_TIMEOUT,
-                )
-                await asyncio.wait_for(sandbox.kill(), timeout=10)
-            except Exception as exc:
-                logger.warning(f"[E2B] Failed to kill sandbox {sandbox_meta['sandbox_id']}: {exc}")
+            await self._kill_sandbox_quietly(sandbox_meta["sandbox_id"])
             self._delete_sandbox_session(session_id)
-            return f"Sandbox killed.\nSandbox ID: {sandbox_meta['sandbox_id']}"
+            for job in self._get_running_jobs(session_id):
+                self._set_job_finished(job, "cancelled")
+        self._discard_session_lock(session_id)
+        return f"Sandbox killed.\nSandbox ID: {sandbox_meta['sandbox_id']}"
 
     async def get_session_sandbox_status(self, event: AstrMessageEvent):
         denied_message = self._get_user_access_denied_message(event)
@@ -642,7 +1977,6 @@ class Main(star.Star):
             return denied_message
 
         session_id = self._get_session_id(event)
-        await self._cleanup_expired_sessions()
         self._mark_session_active(event)
 
         sandbox_meta = self.sandbox_sessions.get(session_id)
@@ -655,12 +1989,31 @@ class Main(star.Star):
             if last_active
             else "unknown"
         )
-        return (
+        status_text = (
             f"Sandbox ID: {sandbox_meta['sandbox_id']}\n"
             f"Status: {sandbox_meta.get('status', 'unknown')}\n"
             f"Template: {sandbox_meta.get('template') or '(default)'}\n"
             f"Last active: {last_active_text}"
         )
+        idle_pause = self._idle_pause_tasks.get(session_id)
+        if idle_pause is not None:
+            remaining = max(0, int(idle_pause["deadline"] - time.time()))
+            status_text += f"\nAuto-pause in: {remaining}s"
+        running_jobs = self._get_running_jobs(session_id)
+        if running_jobs:
+            status_text += "\nBackground jobs running: " + ", ".join(job["job_id"] for job in running_jobs)
+
+        is_admin = getattr(event, "is_admin", None)
+        if callable(is_admin) and is_admin():
+            latency_summary = self._format_latency_summary()
+            if latency_summary:
+                status_text += f"\n\nLatency (run_python_code):\n{latency_summary}"
+            if self._loop_watchdog is not None:
+                status_text += (
+                    f"\nEvent loop: max lag {self._loop_watchdog.max_lag * 1000:.0f}ms, "
+                    f"{self._loop_watchdog.stalls} stall(s) over {self._loop_watchdog.threshold * 1000:.0f}ms"
+                )
+        return status_text
 
     async def e2b_list_files(self, event: AstrMessageEvent, query: str = ""):
         """List generated files cached from the latest E2B execution in this session."""
@@ -675,11 +2028,248 @@ class Main(star.Star):
 
         lines = []
         for index, file_meta in enumerate(generated_files, start=1):
+            pending_note = "" if file_meta.get("local_path") else ", downloaded on send"
             lines.append(
-                f"{index}. {file_meta['name']} ({file_meta['size']} bytes, source: {file_meta['remote_path']})"
+                f"{index}. {file_meta['name']} ({file_meta['size']} bytes, source: {file_meta['remote_path']}{pending_note})"
             )
         return "Cached generated files:\n" + "\n".join(lines)
 
+    async def read_execution_output(
+        self,
+        event: AstrMessageEvent,
+        stream: str = "stdout",
+        execution_id: str = "",
+        offset: int = 0,
+        length: int = 0,
+        start_line: int = 0,
+        end_line: int = 0,
+        pattern: str = "",
+    ):
+        denied_message = self._get_user_access_denied_message(event)
+        if denied_message:
+            return denied_message
+        session_id = self._get_session_id(event)
+        self._mark_session_active(event)
+
+        stream = str(stream or "stdout").strip().lower()
+        if stream not in OUTPUT_STREAMS:
+            return f"Unknown stream: {stream}. Use one of: {', '.join(OUTPUT_STREAMS)}."
+
+        execution_dir = self._find_spooled_execution(session_id, str(execution_id or "").strip())
+        if execution_dir is None:
+            return "No saved output found for this session. Only the last few executions are kept."
+
+        meta = json.loads((execution_dir / "meta.json").read_text(encoding="utf-8"))
+        total = meta.get("sizes", {}).get(stream, 0)
+        if not total:
+            return f"Execution {execution_dir.name} produced no {stream} output."
+
+        output_limit = self._safe_int(
+            self.config.get("max_output_length"),
+            DEFAULT_OUTPUT_LIMIT,
+            minimum=200,
+            maximum=MAX_RESULT_LIMIT,
+        )
+        header, content = await asyncio.to_thread(
+            self._read_spooled_output,
+            execution_dir / f"{stream}.txt.gz",
+            self._safe_int(offset, 0, minimum=0),
+            self._safe_int(length, 0, minimum=0),
+            self._safe_int(start_line, 0, minimum=0),
+            self._safe_int(end_line, 0, minimum=0),
+            str(pattern or ""),
+            output_limit,
+        )
+        summary = f"Execution {execution_dir.name} {stream} ({total} characters saved): {header}"
+        if stream in meta.get("truncated", []):
+            summary += f"\nNote: only the first {MAX_OUTPUT_SPOOL_CHARS} characters were saved."
+        return f"{summary}\n{content}"
+
+    async def submit_job(self, event: AstrMessageEvent, code: str = "", template: str = ""):
+        if not code:
+            return "Error: No code received."
+
+        denied_message = self._get_user_access_denied_message(event)
+        if denied_message:
+            return denied_message
+
+        match = re.search(r"```(?:python)?\s*(.*?)```", code, re.DOTALL | re.IGNORECASE)
+        code_to_run = match.group(1).strip() if match else code.strip()
+
+        session_id = self._get_session_id(event)
+        self._mark_session_active(event)
+
+        api_key = self.config.get("e2b_api_key", "")
+        if not api_key:
+            return "Error: E2B API Key is missing."
+        if AsyncSandbox is None:
+            return "Error: AsyncSandbox class not found."
+
+        limit_error = self._get_job_limit_error(session_id)
+        if limit_error:
+            return limit_error
+
+        job_timeout = self._get_job_timeout()
+        pending_files = self._get_pending_files(event)
+        job_id = uuid.uuid4().hex[:8]
+        job_dir = f"{JOB_ROOT_DIR}/{job_id}"
+        notices = []
+        sandbox = None
+
+        async with self._get_session_lock(session_id):
+            # Another submit may have started a job while this one waited for the lock.
+            limit_error = self._get_job_limit_error(session_id)
+            if limit_error:
+                return limit_error
+            self._cancel_idle_pause(session_id)
+            try:
+                sandbox, sandbox_meta, sandbox_notice = await self._get_or_create_session_sandbox(
+                    event=event,
+                    template=template,
+                    timeout=self._get_sandbox_lifespan(job_timeout + JOB_KILL_GRACE_SECONDS),
+                    create_if_missing=True,
+                )
+                if sandbox_notice:
+                    notices.append(f"[System Notification] {sandbox_notice}")
+
+                uploaded_paths = await self._stage_pending_files(event, session_id, sandbox, pending_files)
+                if uploaded_paths:
+                    notices.append("[System Notification] Uploaded files: " + ", ".join(uploaded_paths))
+
+                packages = self._detect_packages(code_to_run)
+                if packages:
+                    await self._install_dependencies(session_id, sandbox, packages)
+
+                await sandbox.files.write(f"{job_dir}/job.py", code_to_run)
+                handle = await sandbox.commands.run(
+                    self._build_job_command(job_dir, job_timeout),
+                    background=True,
+                    timeout=0,
+                )
+                # Output goes to files in the job dir, so drop the stream instead of holding it open.
+                disconnect = getattr(handle, "disconnect", None)
+                if callable(disconnect):
+                    result = disconnect()
+                    if inspect.isawaitable(result):
+                        await result
+            except Exception as exc:
+                logger.error(f"[E2B] Job submission failed: {traceback.format_exc()}")
+                if sandbox is not None:
+                    self._sandbox_handles.invalidate(self._extract_sandbox_id(sandbox))
+                return f"Runtime Error: {exc}"
+
+            self._update_sandbox_session(
+                session_id,
+                sandbox_meta["sandbox_id"],
+                template=sandbox_meta.get("template", ""),
+                status="running",
+            )
+
+            now = time.time()
+            job = {
+                "job_id": job_id,
+                "session_id": session_id,
+                "sandbox_id": sandbox_meta["sandbox_id"],
+                "status": "running",
+                "created_at": now,
+                "deadline": now + job_timeout,
+                "finished_at": 0,
+                "exit_code": None,
+                "offsets": {"stdout": 0, "stderr": 0},
+            }
+            self.jobs[job_id] = job
+        self._store.upsert_job(job)
+        self._ensure_background_tasks()
+        logger.info(f"[E2B] Started background job {job_id} in sandbox {job['sandbox_id']}")
+
+        notices.append(
+            f"Background job {job_id} started in sandbox {job['sandbox_id']} (time limit {job_timeout}s)."
+        )
+        return (
+            "\n\n".join(notices)
+            + "\n\n[SYSTEM COMMAND: Do not wait for the job in this turn. Tell the user the job ID. "
+            "Use e2b_sandbox_job_status to check progress and read new output, and e2b_sandbox_job_cancel to stop it. "
+            "The user is notified automatically when the job finishes.]"
+        )
+
+    def _get_job_limit_error(self, session_id: str):
+        running_jobs = self._get_running_jobs(session_id)
+        if len(running_jobs) < MAX_RUNNING_JOBS_PER_SESSION:
+            return ""
+        return (
+            f"Error: {len(running_jobs)} background jobs are already running in this session "
+            f"({', '.join(job['job_id'] for job in running_jobs)}). "
+            "Wait for one to finish or stop it with e2b_sandbox_job_cancel."
+        )
+
+    async def get_job_status(self, event: AstrMessageEvent, job_id: str = ""):
+        denied_message = self._get_user_access_denied_message(event)
+        if denied_message:
+            return denied_message
+
+        session_id = self._get_session_id(event)
+        self._mark_session_active(event)
+
+        job_id = str(job_id or "").strip()
+        job = self._find_job(session_id, job_id)
+        if job is None:
+            if job_id:
+                return f"Job {job_id} was not found in this session."
+            return "No background jobs found for this session."
+
+        report = await self._describe_job(job)
+        if not job_id:
+            others = [
+                f"{other['job_id']} ({other['status']})"
+                for other in self._get_session_jobs(session_id)
+                if other is not job
+            ]
+            if others:
+                report += "\n\nOther jobs: " + ", ".join(others)
+        return report
+
+    async def cancel_job(self, event: AstrMessageEvent, job_id: str = ""):
+        denied_message = self._get_user_access_denied_message(event)
+        if denied_message:
+            return denied_message
+
+        session_id = self._get_session_id(event)
+        self._mark_session_active(event)
+
+        job_id = str(job_id or "").strip()
+        # The job monitor completes jobs under the same lock, so the state checked here cannot go stale.
+        async with self._get_session_lock(session_id):
+            job = self._find_job(session_id, job_id, running_only=not job_id)
+            if job is None:
+                if job_id:
+                    return f"Job {job_id} was not found in this session."
+                return "No running background job found for this session."
+            if job["status"] != "running":
+                return f"Job {job['job_id']} is already {job['status']}."
+            if self._is_job_sandbox_paused(job):
+                return (
+                    f"Job {job['job_id']} is suspended because the sandbox is paused. "
+                    "Call e2b_sandbox_resume first, then cancel it."
+                )
+
+            try:
+                sandbox = await self._connect_to_existing_sandbox(
+                    job["sandbox_id"],
+                    timeout=self._get_job_lifespan(job),
+                )
+                result = await self._run_sandbox_helper(
+                    sandbox,
+                    "job_cancel",
+                    {"job_dir": f"{JOB_ROOT_DIR}/{job['job_id']}", "grace": JOB_KILL_GRACE_SECONDS},
+                    timeout=JOB_KILL_GRACE_SECONDS * 2 + 30,
+                )
+            except Exception as exc:
+                logger.warning(f"[E2B] Failed to cancel job {job['job_id']}: {exc}")
+                return f"Failed to cancel job {job['job_id']}: {exc}"
+
+            await self._complete_job(job, result, notify=False)
+        return f"Job {job['job_id']} is now {job['status']}."
+
     async def e2b_send_file(
         self,
         event: AstrMessageEvent,
@@ -716,19 +2306,63 @@ class Main(star.Star):
         if selected is None:
             selected = generated_files[0]
 
+        signature = selected.get("signature")
+        if signature and signature in self.sent_file_signatures[session_id]:
+            return f"File already sent in this session: {selected['name']}"
+
+        if not selected.get("local_path"):
+            fetch_error = await self._fetch_lazy_generated_file(event, session_id, selected)
+            if fetch_error:
+                return fetch_error
+            signature = selected.get("signature")
+
         local_path = Path(selected["local_path"])
         if not local_path.exists():
             return f"Cached file not found on disk: {selected['name']}"
 
-        signature = selected.get("signature")
-        if signature in self.sent_file_signatures[session_id]:
-            return f"File already sent in this session: {selected['name']}"
-
         await self._send_local_file(event, local_path)
         if signature:
             self.sent_file_signatures[session_id].add(signature)
         return f"Sent file to user: {selected['name']}"
 
+    async def _fetch_lazy_generated_file(self, event: AstrMessageEvent, session_id: str, file_meta):
+        sandbox_meta = self.sandbox_sessions.get(session_id) or {}
+        if not file_meta.get("sandbox_id") or sandbox_meta.get("sandbox_id") != file_meta["sandbox_id"]:
+            return f"The sandbox that generated {file_meta['name']} is no longer available."
+
+        restore_pause = sandbox_meta.get("status") == "paused" or session_id in self._idle_pause_tasks
+        self._cancel_idle_pause(session_id)
+        async with self._get_session_lock(session_id):
+            sandbox, sandbox_meta, _ = await self._get_or_create_session_sandbox(
+                event=event,
+                timeout=DEFAULT_SANDBOX_TIMEOUT,
+                create_if_missing=False,
+            )
+            if sandbox is None:
+                return f"The sandbox that generated {file_meta['name']} is no longer available."
+            try:
+                downloaded = await self._download_generated_files(
+                    sandbox, session_id, [file_meta], keep_duplicates=True
+                )
+            finally:
+                if restore_pause:
+                    await self._release_sandbox(session_id, sandbox, sandbox_meta)
+
+        if not downloaded:
+            return f"Failed to download generated file from the sandbox: {file_meta['name']}"
+        if downloaded[0]["signature"] in self.sent_file_signatures[session_id]:
+            Path(downloaded[0]["local_path"]).unlink(missing_ok=True)
+            file_meta["signature"] = downloaded[0]["signature"]
+            return f"File already sent in this session: {file_meta['name']}"
+        if file_meta.get("md5") and not downloaded[0]["signature"].endswith(f":{file_meta['md5']}"):
+            logger.info(f"[E2B] Generated file {file_meta['name']} changed after execution; sending latest content")
+        file_meta.update(
+            local_path=downloaded[0]["local_path"],
+            size=downloaded[0]["size"],
+            signature=downloaded[0]["signature"],
+        )
+        return ""
+
     def _get_plugin_data_dir(self):
         if get_astrbot_data_path is not None:
             return Path(get_astrbot_data_path()) / "plugin_data" / getattr(self, "name", PLUGIN_NAME)
@@ -736,27 +2370,97 @@ class Main(star.Star):
 
     def _load_sandbox_sessions(self):
         self._plugin_data_dir.mkdir(parents=True, exist_ok=True)
-        if not self._sandbox_state_path.exists():
+        try:
+            self.sandbox_sessions = self._store.load_sessions()
+        except Exception as exc:
+            logger.warning(f"[E2B] Failed to load sandbox session state: {exc}")
             self.sandbox_sessions = {}
+        # The kernel that received the font setup may not survive a plugin restart; redo it on next plot.
+        for sandbox_meta in self.sandbox_sessions.values():
+            sandbox_meta.pop("plot_ready", None)
+
+        if not self._sandbox_state_path.exists():
             return
 
         try:
             with open(self._sandbox_state_path, "r", encoding="utf-8") as file_obj:
                 loaded = json.load(file_obj)
-            self.sandbox_sessions = loaded if isinstance(loaded, dict) else {}
+            legacy_sessions = {
+                str(session_id): meta
+                for session_id, meta in (loaded if isinstance(loaded, dict) else {}).items()
+                if isinstance(meta, dict) and meta.get("sandbox_id") and session_id not in self.sandbox_sessions
+            }
+            for meta in legacy_sessions.values():
+                meta.pop("plot_ready", None)
+            self.sandbox_sessions.update(legacy_sessions)
+            self._store.upsert_sessions(legacy_sessions)
+            self._sandbox_state_path.replace(self._sandbox_state_path.with_suffix(".json.migrated"))
+            logger.info(f"[E2B] Migrated {len(legacy_sessions)} sandbox session(s) from JSON to SQLite")
         except Exception as exc:
-            logger.warning(f"[E2B] Failed to load sandbox session state: {exc}")
-            self.sandbox_sessions = {}
+            logger.warning(f"[E2B] Failed to migrate legacy sandbox session state: {exc}")
+
+    def _persist_sandbox_session(self, session_id: str):
+        sandbox_meta = self.sandbox_sessions.get(session_id)
+        if sandbox_meta:
+            self._store.upsert_session(session_id, sandbox_meta)
+        else:
+            self._store.delete_session(session_id)
+
+    def _load_warm_pool(self):
+        try:
+            self.warm_pool = self._store.load_warm_pool()
+        except Exception as exc:
+            logger.warning(f"[E2B] Failed to load warm pool state: {exc}")
+
+        if not self._warm_pool_path.exists():
+            return
 
-    def _save_sandbox_sessions(self):
-        self._plugin_data_dir.mkdir(parents=True, exist_ok=True)
-        temp_path = self._sandbox_state_path.with_suffix(".tmp")
         try:
-            with open(temp_path, "w", encoding="utf-8") as file_obj:
-                json.dump(self.sandbox_sessions, file_obj, ensure_ascii=False, indent=2)
-            temp_path.replace(self._sandbox_state_path)
+            with open(self._warm_pool_path, "r", encoding="utf-8") as file_obj:
+                loaded = json.load(file_obj)
+            for template, members in (loaded if isinstance(loaded, dict) else {}).items():
+                if not isinstance(members, list):
+                    continue
+                self.warm_pool[str(template)].extend(
+                    member
+                    for member in members
+                    if isinstance(member, dict) and member.get("sandbox_id")
+                )
+            self._save_warm_pool()
+            self._warm_pool_path.replace(self._warm_pool_path.with_suffix(".json.migrated"))
         except Exception as exc:
-            logger.warning(f"[E2B] Failed to save sandbox session state: {exc}")
+            logger.warning(f"[E2B] Failed to migrate legacy warm pool state: {exc}")
+
+    def _save_warm_pool(self):
+        self._store.replace_warm_pool(self.warm_pool)
+
+    def _ensure_background_tasks(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        if self._warm_pool_task is None or self._warm_pool_task.done():
+            if self._get_warm_pool_size() > 0 or any(self.warm_pool.values()):
+                self._warm_pool_wakeup = asyncio.Event()
+                self._warm_pool_task = loop.create_task(self._warm_pool_loop())
+
+        if self._loop_watchdog is None:
+            watchdog_ms = self._safe_int(self.config.get("loop_watchdog_ms"), DEFAULT_LOOP_WATCHDOG_MS, minimum=0)
+            if watchdog_ms > 0:
+                self._loop_watchdog = LoopLagWatchdog(
+                    max(watchdog_ms, MIN_LOOP_WATCHDOG_MS) / 1000,
+                    self._plugin_data_dir / "diagnostics.log",
+                )
+                self._loop_watchdog.start(loop)
+
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_wakeup = asyncio.Event()
+            self._reaper_task = loop.create_task(self._session_reaper_loop())
+
+        if self._job_monitor_task is None or self._job_monitor_task.done():
+            if any(job["status"] == "running" for job in self.jobs.values()):
+                self._job_monitor_task = loop.create_task(self._job_monitor_loop())
 
     def _get_session_lock(self, session_id: str):
         lock = self.session_locks.get(session_id)
@@ -765,6 +2469,13 @@ class Main(star.Star):
             self.session_locks[session_id] = lock
         return lock
 
+    def _discard_session_lock(self, session_id: str):
+        # Only drop a lock nobody holds or waits for; a waiter must keep the object it queued on.
+        lock = self.session_locks.get(session_id)
+        if lock is None or lock.locked() or getattr(lock, "_waiters", None):
+            return
+        self.session_locks.pop(session_id, None)
+
     def _normalize_user_whitelist(self):
         raw_value = self.config.get("user_whitelist", [])
         if isinstance(raw_value, str):
@@ -827,44 +2538,87 @@ class Main(star.Star):
         template: str = "",
         status: str = "running",
     ):
-        self.sandbox_sessions[session_id] = {
-            "sandbox_id": str(sandbox_id),
-            "template": str(template or ""),
-            "status": status,
-            "last_active": time.time(),
-        }
-        self._save_sandbox_sessions()
+        previous = self.sandbox_sessions.get(session_id) or {}
+        sandbox_meta = dict(previous) if previous.get("sandbox_id") == str(sandbox_id) else {}
+        sandbox_meta.update(
+            sandbox_id=str(sandbox_id),
+            template=str(template or ""),
+            status=status,
+            last_active=time.time(),
+        )
+        self.sandbox_sessions[session_id] = sandbox_meta
+        self._persist_sandbox_session(session_id)
+        self._schedule_session_expiry(session_id)
 
     def _delete_sandbox_session(self, session_id: str):
         self.sandbox_sessions.pop(session_id, None)
-        self._save_sandbox_sessions()
+        self._persist_sandbox_session(session_id)
 
-    async def _cleanup_expired_sessions(self):
-        now = time.time()
-        cutoff = now - DEFAULT_SESSION_RETENTION_HOURS * 3600
-        expired_session_ids = {
-            session_id
-            for session_id, last_access in self.session_last_access.items()
-            if last_access < cutoff
-        }
-        expired_session_ids.update(
-            session_id
-            for session_id, meta in self.sandbox_sessions.items()
-            if float(meta.get("last_active", 0) or 0) < cutoff
+    def _session_deadline(self, session_id: str):
+        last_active = max(
+            float(self.session_last_access.get(session_id, 0) or 0),
+            float((self.sandbox_sessions.get(session_id) or {}).get("last_active", 0) or 0),
         )
+        return last_active + DEFAULT_SESSION_RETENTION_HOURS * 3600
 
-        if not expired_session_ids:
+    def _schedule_session_expiry(self, session_id: str):
+        if session_id in self._expiry_scheduled:
             return
+        deadline = self._session_deadline(session_id)
+        self._expiry_scheduled.add(session_id)
+        heapq.heappush(self._expiry_heap, (deadline, session_id))
+        if self._reaper_wakeup is not None and self._expiry_heap[0][1] == session_id:
+            self._reaper_wakeup.set()
+
+    async def _session_reaper_loop(self):
+        cutoff = time.time() - DEFAULT_SESSION_RETENTION_HOURS * 3600
+        try:
+            overdue = await self._store.expired_session_ids(cutoff)
+        except Exception as exc:
+            logger.warning(f"[E2B] Failed to query expired sessions: {exc}")
+            overdue = []
+        for session_id in set(overdue) | set(self.sandbox_sessions) | set(self.session_last_access):
+            self._schedule_session_expiry(session_id)
+
+        semaphore = asyncio.Semaphore(REAPER_MAX_CONCURRENT_KILLS)
+        while True:
+            now = time.time()
+            due_session_ids = []
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                _, session_id = heapq.heappop(self._expiry_heap)
+                self._expiry_scheduled.discard(session_id)
+                if self._session_deadline(session_id) <= now:
+                    due_session_ids.append(session_id)
+                elif session_id in self.session_last_access or session_id in self.sandbox_sessions:
+                    self._schedule_session_expiry(session_id)
+
+            if due_session_ids:
+                await asyncio.gather(
+                    *(self._expire_session(session_id, semaphore) for session_id in due_session_ids),
+                    return_exceptions=True,
+                )
+                continue
+
+            sleep_seconds = REAPER_MAX_SLEEP_SECONDS
+            if self._expiry_heap:
+                sleep_seconds = min(sleep_seconds, max(0.0, self._expiry_heap[0][0] - now))
+            self._reaper_wakeup.clear()
+            try:
+                await asyncio.wait_for(self._reaper_wakeup.wait(), timeout=sleep_seconds)
+            except asyncio.TimeoutError:
+                pass
 
-        for session_id in expired_session_ids:
+    async def _expire_session(self, session_id: str, semaphore: asyncio.Semaphore):
+        async with semaphore, self._get_session_lock(session_id):
+            if self._session_deadline(session_id) > time.time():
+                self._schedule_session_expiry(session_id)
+                return
+
+            self._cancel_idle_pause(session_id)
             sandbox_meta = self.sandbox_sessions.get(session_id)
             sandbox_id = (sandbox_meta or {}).get("sandbox_id")
             if sandbox_id:
-                try:
-                    sandbox = await self._connect_to_existing_sandbox(sandbox_id, timeout=30)
-                    await asyncio.wait_for(sandbox.kill(), timeout=10)
-                except Exception as exc:
-                    logger.warning(f"[E2B] Failed to cleanup expired sandbox {sandbox_id}: {exc}")
+                await self._kill_sandbox_quietly(sandbox_id)
 
             self.session_last_access.pop(session_id, None)
             self.code_hashes.pop(session_id, None)
@@ -872,11 +2626,15 @@ class Main(star.Star):
             self.session_files.pop(session_id, None)
             self.generated_files.pop(session_id, None)
             self.sent_file_signatures.pop(session_id, None)
-            self.session_locks.pop(session_id, None)
+            self.sent_image_hashes.pop(session_id, None)
+            self._drop_session_jobs(session_id)
             self.sandbox_sessions.pop(session_id, None)
+            self._persist_sandbox_session(session_id)
+            await asyncio.to_thread(
+                shutil.rmtree, self._get_output_spool_dir(session_id), ignore_errors=True
+            )
             logger.info(f"[E2B] Cleaned expired session cache: {session_id}")
-
-        self._save_sandbox_sessions()
+        self._discard_session_lock(session_id)
 
     async def _get_or_create_session_sandbox(
         self,
@@ -886,6 +2644,9 @@ class Main(star.Star):
         create_if_missing: bool = True,
     ):
         session_id = self._get_session_id(event)
+        self._cancel_idle_pause(session_id)
+        for job in self._get_running_jobs(session_id):
+            timeout = max(timeout, self._get_job_lifespan(job))
         sandbox_meta = self.sandbox_sessions.get(session_id, {})
         requested_template = self._effective_template(template)
         existing_template = str(sandbox_meta.get("template") or "")
@@ -916,17 +2677,24 @@ class Main(star.Star):
         if not create_if_missing:
             return None, {}, ""
 
-        api_key = self.config.get("e2b_api_key", "")
-        proxy = str(self.config.get("proxy", DEFAULT_PROXY) or "").strip()
-        sandbox = await self._create_sandbox(
-            api_key=api_key,
-            timeout=timeout,
-            proxy=proxy,
-            template=requested_template,
-        )
-        sandbox_id = self._extract_sandbox_id(sandbox)
+        sandbox = await self._claim_warm_sandbox(requested_template, timeout=timeout)
+        if sandbox is not None:
+            sandbox_id = self._extract_sandbox_id(sandbox)
+            notice = f"Created sandbox {sandbox_id} for this session (claimed from warm pool)."
+        else:
+            api_key = self.config.get("e2b_api_key", "")
+            proxy = str(self.config.get("proxy", DEFAULT_PROXY) or "").strip()
+            sandbox = await self._create_sandbox(
+                api_key=api_key,
+                timeout=timeout,
+                proxy=proxy,
+                template=requested_template,
+            )
+            sandbox_id = self._extract_sandbox_id(sandbox)
+            notice = f"Created sandbox {sandbox_id} for this session."
         if not sandbox_id:
             raise RuntimeError("Sandbox created, but the SDK did not expose a sandbox ID.")
+        self._sandbox_handles.put(sandbox_id, sandbox, timeout)
 
         self._update_sandbox_session(
             session_id,
@@ -934,9 +2702,13 @@ class Main(star.Star):
             template=requested_template,
             status="running",
         )
-        return sandbox, self.sandbox_sessions[session_id], f"Created sandbox {sandbox_id} for this session."
+        return sandbox, self.sandbox_sessions[session_id], notice
 
     async def _connect_to_existing_sandbox(self, sandbox_id: str, timeout: int = DEFAULT_SANDBOX_TIMEOUT):
+        sandbox = await self._get_cached_sandbox(sandbox_id, timeout)
+        if sandbox is not None:
+            return sandbox
+
         if AsyncSandbox is None:
             raise RuntimeError("AsyncSandbox class not found.")
 
@@ -954,12 +2726,58 @@ class Main(star.Star):
             "proxy": proxy or None,
             "timeout": timeout,
         }
-        return await self._call_sandbox_entrypoint(
+        sandbox = await self._call_sandbox_entrypoint(
             connect_method,
             connect_kwargs,
             call_timeout=20,
             action_name="connect",
         )
+        self._sandbox_handles.put(sandbox_id, sandbox, timeout)
+        return sandbox
+
+    async def _get_cached_sandbox(self, sandbox_id: str, timeout: int):
+        entry = self._sandbox_handles.get(sandbox_id)
+        if entry is None:
+            return None
+
+        sandbox = entry["sandbox"]
+        if entry["expires_at"] - time.time() < timeout + SANDBOX_HANDLE_TTL_MARGIN_SECONDS:
+            # connect() used to reset the sandbox TTL on every call; extend it explicitly so a long
+            # execution cannot outlive the sandbox. A successful call also proves the sandbox is up.
+            set_timeout = getattr(sandbox, "set_timeout", None)
+            try:
+                if not callable(set_timeout):
+                    raise RuntimeError("set_timeout() is not supported by this SDK")
+                result = set_timeout(timeout)
+                if inspect.isawaitable(result):
+                    await asyncio.wait_for(result, timeout=5)
+            except Exception as exc:
+                logger.info(f"[E2B] Could not extend cached sandbox handle {sandbox_id}, reconnecting: {exc}")
+                self._sandbox_handles.invalidate(sandbox_id)
+                return None
+            now = time.time()
+            entry["expires_at"] = now + timeout
+            entry["validated_at"] = now
+            return sandbox
+
+        if time.time() - entry["validated_at"] < SANDBOX_HANDLE_VALIDATE_AFTER_SECONDS:
+            return sandbox
+
+        is_running = getattr(sandbox, "is_running", None)
+        if callable(is_running):
+            try:
+                running = is_running()
+                if inspect.isawaitable(running):
+                    running = await asyncio.wait_for(running, timeout=5)
+            except Exception as exc:
+                logger.info(f"[E2B] Cached sandbox handle {sandbox_id} failed health check: {exc}")
+                running = False
+            if not running:
+                self._sandbox_handles.invalidate(sandbox_id)
+                return None
+
+        entry["validated_at"] = time.time()
+        return sandbox
 
     async def _call_sandbox_entrypoint(self, method, kwargs, call_timeout: int, action_name: str):
         filtered_kwargs = {k: v for k, v in kwargs.items() if v is not None}
@@ -987,6 +2805,7 @@ class Main(star.Star):
         return result
 
     async def _pause_sandbox(self, sandbox):
+        self._sandbox_handles.invalidate(self._extract_sandbox_id(sandbox))
         for method_name in ("pause", "beta_pause"):
             pause_method = getattr(sandbox, method_name, None)
             if pause_method is None:
@@ -1000,6 +2819,567 @@ class Main(star.Star):
             "Current E2B SDK does not support pause(). Upgrade to a newer E2B SDK with sandbox persistence support."
         )
 
+    @contextmanager
+    def _time_phase(self, spans: dict, phase: str):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            spans[phase] = spans.get(phase, 0.0) + time.perf_counter() - started_at
+
+    def _record_latency(self, session_id: str, template: str, spans: dict):
+        sandbox_meta = self.sandbox_sessions.get(session_id) or {}
+        template_name = sandbox_meta.get("template") or self._effective_template(template) or "default"
+        self._latency.record(template_name, spans)
+        logger.debug(
+            "[E2B] Phase timings: "
+            + ", ".join(f"{phase}={seconds:.3f}s" for phase, seconds in spans.items())
+        )
+        if time.time() - self._metrics_flushed_at < METRICS_FLUSH_INTERVAL_SECONDS:
+            return
+        task = asyncio.create_task(self._flush_metrics())
+        self._metrics_tasks.add(task)
+        task.add_done_callback(self._metrics_tasks.discard)
+
+    async def _flush_metrics(self, force: bool = False):
+        now = time.time()
+        if not force and now - self._metrics_flushed_at < METRICS_FLUSH_INTERVAL_SECONDS:
+            return
+        self._metrics_flushed_at = now
+        try:
+            text = self._latency.render_prometheus()
+            if self._loop_watchdog is not None:
+                text += self._loop_watchdog.render_prometheus()
+            await asyncio.to_thread(self._write_metrics_file, text)
+        except Exception as exc:
+            logger.warning(f"[E2B] Failed to write latency metrics: {exc}")
+
+    def _write_metrics_file(self, text: str):
+        tmp_path = self._metrics_path.with_suffix(".prom.tmp")
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, self._metrics_path)
+
+    def _format_latency_summary(self):
+        lines = []
+        for template in self._latency.templates():
+            lines.append(f"Template {template}:")
+            for phase in self._latency.phases(template):
+                quantiles = self._latency.quantiles(template, phase)
+                lines.append(
+                    f"  {phase}: "
+                    + " ".join(f"p{int(q * 100)}={value:.2f}s" for q, value in quantiles.items())
+                    + f" (n={self._latency.count(template, phase)})"
+                )
+        return "\n".join(lines)
+
+    def _get_sandbox_lifespan(self, exec_timeout: int = None):
+        if exec_timeout is None:
+            exec_timeout = self._safe_int(self.config.get("timeout"), DEFAULT_EXEC_TIMEOUT, minimum=5)
+        return max(exec_timeout + 30, DEFAULT_SANDBOX_TIMEOUT)
+
+    def _schedule_speculative_prewarm(self, event: AstrMessageEvent):
+        session_id = self._get_session_id(event)
+        if not (self.sandbox_sessions.get(session_id) or {}).get("sandbox_id"):
+            return
+        if self._get_session_lock(session_id).locked():
+            return
+        pending = self._prewarm_tasks.get(session_id)
+        if pending is not None and not pending.done():
+            return
+        self._prewarm_tasks[session_id] = asyncio.create_task(
+            self._run_speculative_prewarm(event, session_id)
+        )
+
+    async def _run_speculative_prewarm(self, event: AstrMessageEvent, session_id: str):
+        try:
+            async with self._get_session_lock(session_id):
+                sandbox_meta = self.sandbox_sessions.get(session_id) or {}
+                if not sandbox_meta.get("sandbox_id"):
+                    return
+                kept_running = (
+                    sandbox_meta.get("status") == "running" and session_id not in self._idle_pause_tasks
+                )
+
+                sandbox, sandbox_meta, _ = await self._get_or_create_session_sandbox(
+                    event=event,
+                    timeout=self._get_sandbox_lifespan(),
+                    create_if_missing=False,
+                )
+                if sandbox is None:
+                    return
+
+                pending_files = list(self.session_files.get(session_id, []))
+                if pending_files:
+                    await self._stage_pending_files(event, session_id, sandbox, pending_files)
+
+                if not kept_running:
+                    hold_seconds = max(self._get_auto_pause_idle_seconds(), SPECULATIVE_PREWARM_HOLD_SECONDS)
+                    self._schedule_idle_pause(session_id, sandbox_meta["sandbox_id"], hold_seconds)
+                logger.info(
+                    f"[E2B] Speculatively prewarmed sandbox {sandbox_meta['sandbox_id']} for session {session_id}"
+                )
+        except Exception as exc:
+            logger.info(f"[E2B] Speculative prewarm skipped for session {session_id}: {exc}")
+        finally:
+            if self._prewarm_tasks.get(session_id) is asyncio.current_task():
+                self._prewarm_tasks.pop(session_id, None)
+
+    def _get_auto_pause_idle_seconds(self):
+        return self._safe_int(
+            self.config.get("auto_pause_idle_seconds"),
+            DEFAULT_AUTO_PAUSE_IDLE_SECONDS,
+            minimum=0,
+            maximum=MAX_AUTO_PAUSE_IDLE_SECONDS,
+        )
+
+    async def _release_sandbox(self, session_id: str, sandbox, sandbox_meta):
+        if self._get_running_jobs(session_id):
+            return "Sandbox kept running because background jobs are active."
+
+        idle_seconds = self._get_auto_pause_idle_seconds()
+        if idle_seconds > 0:
+            self._schedule_idle_pause(session_id, sandbox_meta["sandbox_id"], idle_seconds)
+            return f"Sandbox will auto-pause after {idle_seconds}s of inactivity."
+
+        pause_method = await self._pause_sandbox(sandbox)
+        self._update_sandbox_session(
+            session_id,
+            sandbox_meta["sandbox_id"],
+            template=sandbox_meta.get("template", ""),
+            status="paused",
+        )
+        return f"Sandbox auto-paused with {pause_method}."
+
+    def _schedule_idle_pause(self, session_id: str, sandbox_id: str, delay: int):
+        self._cancel_idle_pause(session_id)
+        task = asyncio.create_task(self._run_idle_pause(session_id, sandbox_id, delay))
+        self._idle_pause_tasks[session_id] = {
+            "task": task,
+            "sandbox_id": sandbox_id,
+            "deadline": time.time() + delay,
+        }
+
+    def _cancel_idle_pause(self, session_id: str):
+        pending = self._idle_pause_tasks.pop(session_id, None)
+        if pending is not None:
+            pending["task"].cancel()
+
+    async def _run_idle_pause(self, session_id: str, sandbox_id: str, delay: int):
+        await asyncio.sleep(delay)
+        async with self._get_session_lock(session_id):
+            pending = self._idle_pause_tasks.get(session_id)
+            if pending is None or pending["task"] is not asyncio.current_task():
+                return
+            self._idle_pause_tasks.pop(session_id, None)
+            await self._pause_idle_sandbox(session_id, sandbox_id)
+
+    async def _pause_idle_sandbox(self, session_id: str, sandbox_id: str):
+        sandbox_meta = self.sandbox_sessions.get(session_id) or {}
+        if sandbox_meta.get("sandbox_id") != sandbox_id or sandbox_meta.get("status") != "running":
+            return
+        if self._get_running_jobs(session_id):
+            return
+
+        try:
+            sandbox = await self._connect_to_existing_sandbox(sandbox_id, timeout=DEFAULT_SANDBOX_TIMEOUT)
+            pause_method = await self._pause_sandbox(sandbox)
+        except Exception as exc:
+            logger.warning(f"[E2B] Idle auto-pause failed for sandbox {sandbox_id}: {exc}")
+            return
+
+        self._update_sandbox_session(
+            session_id,
+            sandbox_id,
+            template=sandbox_meta.get("template", ""),
+            status="paused",
+        )
+        logger.info(f"[E2B] Sandbox {sandbox_id} auto-paused with {pause_method} after idle window")
+
+    async def _flush_idle_pauses(self):
+        pending_items = list(self._idle_pause_tasks.items())
+        self._idle_pause_tasks.clear()
+        for _session_id, pending in pending_items:
+            pending["task"].cancel()
+        if not pending_items:
+            return
+
+        await asyncio.gather(
+            *(
+                asyncio.wait_for(self._pause_idle_sandbox(session_id, pending["sandbox_id"]), timeout=15)
+                for session_id, pending in pending_items
+            ),
+            return_exceptions=True,
+        )
+
+    def _load_jobs(self):
+        try:
+            self.jobs = self._store.load_jobs()
+        except Exception as exc:
+            logger.warning(f"[E2B] Failed to load background jobs: {exc}")
+
+    def _get_job_timeout(self):
+        return self._safe_int(
+            self.config.get("job_timeout"),
+            DEFAULT_JOB_TIMEOUT,
+            minimum=60,
+            maximum=MAX_JOB_TIMEOUT,
+        )
+
+    def _get_job_lifespan(self, job):
+        remaining = int(job.get("deadline", 0) - time.time()) if job.get("status") == "running" else 0
+        return self._get_sandbox_lifespan(max(0, remaining) + JOB_KILL_GRACE_SECONDS)
+
+    def _build_job_command(self, job_dir: str, job_timeout: int):
+        quoted_dir = shlex_quote(job_dir)
+        return (
+            f"mkdir -p {quoted_dir} && cd {shlex_quote(DEFAULT_WORK_DIR)} && "
+            f"(MPLBACKEND=Agg setsid timeout -k {JOB_KILL_GRACE_SECONDS} {job_timeout} "
+            f"python3 -u {quoted_dir}/job.py > {quoted_dir}/stdout.log 2> {quoted_dir}/stderr.log & "
+            f"echo $! > {quoted_dir}/pid; wait $!; echo $? > {quoted_dir}/exit_code.tmp; "
+            f"mv {quoted_dir}/exit_code.tmp {quoted_dir}/exit_code)"
+        )
+
+    def _get_session_jobs(self, session_id: str):
+        return sorted(
+            (job for job in self.jobs.values() if job["session_id"] == session_id),
+            key=lambda job: job.get("created_at", 0),
+            reverse=True,
+        )
+
+    def _get_running_jobs(self, session_id: str):
+        return [job for job in self._get_session_jobs(session_id) if job["status"] == "running"]
+
+    def _find_job(self, session_id: str, job_id: str = "", running_only: bool = False):
+        if job_id:
+            job = self.jobs.get(job_id)
+            return job if job is not None and job["session_id"] == session_id else None
+        jobs = self._get_running_jobs(session_id) if running_only else self._get_session_jobs(session_id)
+        return jobs[0] if jobs else None
+
+    def _is_job_sandbox_paused(self, job):
+        sandbox_meta = self.sandbox_sessions.get(job["session_id"]) or {}
+        return sandbox_meta.get("sandbox_id") == job["sandbox_id"] and sandbox_meta.get("status") == "paused"
+
+    async def _poll_job(self, job, limit: int = 0, tail: int = 0):
+        sandbox = await self._connect_to_existing_sandbox(job["sandbox_id"], timeout=self._get_job_lifespan(job))
+        result = await self._run_sandbox_helper(
+            sandbox,
+            "job_status",
+            {
+                "job_dir": f"{JOB_ROOT_DIR}/{job['job_id']}",
+                "offsets": job["offsets"],
+                "limit": limit,
+                "tail": tail,
+            },
+        )
+        if limit > 0:
+            job["offsets"] = {stream: result[stream]["offset"] for stream in ("stdout", "stderr")}
+            self._store.upsert_job(job)
+        return result
+
+    async def _describe_job(self, job):
+        lines = [f"Job {job['job_id']}: {job['status']}"]
+        if job["status"] == "running" and self._is_job_sandbox_paused(job):
+            lines.append("The sandbox is paused, so the job is suspended. Call e2b_sandbox_resume to continue it.")
+            return "\n".join(lines)
+        if (self.sandbox_sessions.get(job["session_id"]) or {}).get("sandbox_id") != job["sandbox_id"]:
+            if job["status"] == "running":
+                self._set_job_finished(job, "lost")
+                lines[0] = f"Job {job['job_id']}: lost"
+            lines.append("The sandbox that ran this job no longer exists, so its output is unavailable.")
+            return "\n".join(lines)
+        if self._is_job_sandbox_paused(job):
+            lines.append("The sandbox is paused. Call e2b_sandbox_resume to read the remaining output.")
+            return "\n".join(lines)
+
+        output_limit = self._safe_int(
+            self.config.get("max_output_length"),
+            DEFAULT_OUTPUT_LIMIT,
+            minimum=200,
+            maximum=MAX_RESULT_LIMIT,
+        )
+        try:
+            result = await self._poll_job(job, limit=output_limit // 2)
+        except Exception as exc:
+            lines.append(f"Could not read job output: {exc}")
+            return "\n".join(lines)
+        if job["status"] == "running" and result.get("state") != "running":
+            await self._complete_job(job, result, notify=False)
+            lines[0] = f"Job {job['job_id']}: {job['status']}"
+
+        elapsed = (job.get("finished_at") or time.time()) - job.get("created_at", 0)
+        lines.append(f"Elapsed: {int(elapsed)}s")
+        if job.get("exit_code") is not None:
+            lines.append(f"Exit code: {job['exit_code']}")
+
+        has_output = False
+        for stream in ("stdout", "stderr"):
+            chunk = result.get(stream) or {}
+            if chunk.get("skipped"):
+                lines.append(f"[{chunk['skipped']} bytes of earlier {stream} skipped]")
+            if chunk.get("text"):
+                lines.append(f"{stream.upper()} (new output):\n{chunk['text']}")
+                has_output = True
+        if not has_output:
+            lines.append("No new output since the last check.")
+        return "\n".join(lines)
+
+    def _set_job_finished(self, job, status: str, exit_code=None):
+        job.update(status=status, exit_code=exit_code, finished_at=time.time())
+        self._store.upsert_job(job)
+        self._prune_job_history(job["session_id"])
+
+    async def _complete_job(self, job, result, notify: bool = True):
+        state = result.get("state")
+        exit_code = result.get("exit_code")
+        if state == "finished":
+            if exit_code == 0:
+                state = "succeeded"
+            elif exit_code == JOB_TIMEOUT_EXIT_CODE or time.time() >= job.get("deadline", 0):
+                state = "timed_out"
+            else:
+                state = "failed"
+        elif state not in ("cancelled", "lost"):
+            state = "lost"
+        self._set_job_finished(job, state, exit_code)
+        logger.info(f"[E2B] Background job {job['job_id']} {state} (exit code {exit_code})")
+        self._schedule_pause_after_jobs(job["session_id"])
+        if notify:
+            await self._notify_job_finished(job, result)
+
+    async def _notify_job_finished(self, job, result):
+        elapsed = int(job["finished_at"] - job.get("created_at", job["finished_at"]))
+        text = f"[E2B] Background job {job['job_id']} {job['status']} after {elapsed}s"
+        if job.get("exit_code") is not None:
+            text += f" (exit code {job['exit_code']})"
+        text += "."
+        streams = ("stdout", "stderr") if job["status"] == "succeeded" else ("stderr", "stdout")
+        for stream in streams:
+            tail = ((result.get(stream) or {}).get("tail") or "").strip()
+            if tail:
+                text += f"\nLast {stream}:\n{tail}"
+                break
+        try:
+            await self.context.send_message(job["session_id"], MessageChain().message(text))
+        except Exception as exc:
+            logger.warning(f"[E2B] Failed to notify session about job {job['job_id']}: {exc}")
+
+    def _schedule_pause_after_jobs(self, session_id: str):
+        if self._get_running_jobs(session_id) or session_id in self._idle_pause_tasks:
+            return
+        sandbox_meta = self.sandbox_sessions.get(session_id) or {}
+        if sandbox_meta.get("sandbox_id") and sandbox_meta.get("status") == "running":
+            self._schedule_idle_pause(session_id, sandbox_meta["sandbox_id"], self._get_auto_pause_idle_seconds())
+
+    def _prune_job_history(self, session_id: str):
+        finished = [job for job in self._get_session_jobs(session_id) if job["status"] != "running"]
+        stale_ids = [job["job_id"] for job in finished[MAX_JOB_HISTORY_PER_SESSION:]]
+        for job_id in stale_ids:
+            self.jobs.pop(job_id, None)
+        if stale_ids:
+            self._store.delete_jobs(stale_ids)
+
+    def _drop_session_jobs(self, session_id: str):
+        job_ids = [job["job_id"] for job in self._get_session_jobs(session_id)]
+        for job_id in job_ids:
+            self.jobs.pop(job_id, None)
+        if job_ids:
+            self._store.delete_jobs(job_ids)
+
+    async def _job_monitor_loop(self):
+        while any(job["status"] == "running" for job in self.jobs.values()):
+            await asyncio.sleep(JOB_POLL_INTERVAL_SECONDS)
+            running_jobs = [job for job in self.jobs.values() if job["status"] == "running"]
+            await asyncio.gather(*(self._check_job(job) for job in running_jobs), return_exceptions=True)
+
+    async def _check_job(self, job):
+        if job["status"] != "running":
+            return
+        session_lock = self._get_session_lock(job["session_id"])
+        if session_lock.locked():
+            # A tool call owns the session (possibly cancelling this job); check again next round.
+            return
+        async with session_lock:
+            await self._check_job_locked(job)
+
+    async def _check_job_locked(self, job):
+        if job["status"] != "running":
+            return
+        session_id = job["session_id"]
+        sandbox_meta = self.sandbox_sessions.get(session_id) or {}
+        if sandbox_meta.get("sandbox_id") != job["sandbox_id"]:
+            await self._complete_job(job, {"state": "lost"})
+            return
+        if sandbox_meta.get("status") == "paused":
+            return
+
+        self.session_last_access[session_id] = time.time()
+        try:
+            result = await self._poll_job(job, tail=JOB_NOTIFY_TAIL_CHARS)
+        except Exception as exc:
+            job["poll_failures"] = job.get("poll_failures", 0) + 1
+            logger.warning(f"[E2B] Failed to poll background job {job['job_id']}: {exc}")
+            if job["poll_failures"] >= JOB_MAX_POLL_FAILURES:
+                await self._complete_job(job, {"state": "lost"})
+            return
+
+        job["poll_failures"] = 0
+        if job["status"] == "running" and result.get("state") != "running":
+            await self._complete_job(job, result)
+
+    def _get_warm_pool_size(self):
+        return self._safe_int(
+            self.config.get("warm_pool_size"),
+            DEFAULT_WARM_POOL_SIZE,
+            minimum=0,
+            maximum=MAX_WARM_POOL_SIZE,
+        )
+
+    def _get_warm_pool_max_idle_seconds(self):
+        return self._safe_int(
+            self.config.get("warm_pool_max_idle_minutes"),
+            DEFAULT_WARM_POOL_MAX_IDLE_MINUTES,
+            minimum=1,
+            maximum=24 * 60,
+        ) * 60
+
+    async def _claim_warm_sandbox(self, template: str, timeout: int = DEFAULT_SANDBOX_TIMEOUT):
+        template = self._effective_template(template)
+        self._warm_pool_templates.add(template)
+        max_idle = self._get_warm_pool_max_idle_seconds()
+        stale_ids = []
+        sandbox = None
+
+        while sandbox is None:
+            member = None
+            async with self._warm_pool_locks[template]:
+                members = self.warm_pool.get(template) or []
+                while members and member is None:
+                    candidate = members.pop(0)
+                    if time.time() - float(candidate.get("created_at", 0) or 0) >= max_idle:
+                        stale_ids.append(candidate["sandbox_id"])
+                    else:
+                        member = candidate
+            if member is None:
+                break
+            try:
+                sandbox = await self._connect_to_existing_sandbox(member["sandbox_id"], timeout=timeout)
+                logger.info(f"[E2B] Claimed warm sandbox {member['sandbox_id']} (template={template or 'default'})")
+            except Exception as exc:
+                logger.warning(f"[E2B] Failed to claim warm sandbox {member['sandbox_id']}: {exc}")
+
+        for sandbox_id in stale_ids:
+            task = asyncio.create_task(self._kill_sandbox_quietly(sandbox_id))
+            self._kill_tasks.add(task)
+            task.add_done_callback(self._kill_tasks.discard)
+
+        self._save_warm_pool()
+        if self._warm_pool_wakeup is not None:
+            self._warm_pool_wakeup.set()
+        return sandbox
+
+    async def _warm_pool_loop(self):
+        while True:
+            try:
+                await self._refill_warm_pool()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f"[E2B] Warm pool refill failed: {exc}")
+
+            try:
+                await asyncio.wait_for(
+                    self._warm_pool_wakeup.wait(),
+                    timeout=WARM_POOL_REFILL_INTERVAL_SECONDS,
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._warm_pool_wakeup.clear()
+
+    async def _refill_warm_pool(self):
+        pool_size = self._get_warm_pool_size()
+        api_key = self.config.get("e2b_api_key", "")
+        if pool_size > 0 and (not api_key or AsyncSandbox is None):
+            return
+
+        max_idle = self._get_warm_pool_max_idle_seconds()
+        changed = False
+        templates = set(self.warm_pool) | self._warm_pool_templates | {self._effective_template()}
+        for template in templates:
+            async with self._warm_pool_locks[template]:
+                now = time.time()
+                members = self.warm_pool[template]
+                keep_members = []
+                stale_members = []
+                for member in members:
+                    age = now - float(member.get("created_at", 0) or 0)
+                    if pool_size > 0 and age < max_idle and len(keep_members) < pool_size:
+                        keep_members.append(member)
+                    else:
+                        stale_members.append(member)
+                if stale_members:
+                    members[:] = keep_members
+                    changed = True
+                missing = pool_size - len(members)
+
+            for member in stale_members:
+                await self._kill_sandbox_quietly(member["sandbox_id"])
+                logger.info(f"[E2B] Recycled warm sandbox {member['sandbox_id']}")
+
+            for _ in range(missing):
+                member = await self._create_warm_sandbox(template, api_key)
+                if member is None:
+                    break
+                async with self._warm_pool_locks[template]:
+                    self.warm_pool[template].append(member)
+                changed = True
+
+        if changed:
+            self._save_warm_pool()
+
+    async def _create_warm_sandbox(self, template: str, api_key: str):
+        proxy = str(self.config.get("proxy", DEFAULT_PROXY) or "").strip()
+        sandbox = await self._create_sandbox(
+            api_key=api_key,
+            timeout=DEFAULT_SANDBOX_TIMEOUT,
+            proxy=proxy,
+            template=template,
+        )
+        sandbox_id = self._extract_sandbox_id(sandbox)
+        if not sandbox_id:
+            logger.warning("[E2B] Warm sandbox created, but the SDK did not expose a sandbox ID.")
+            return None
+
+        try:
+            await self._pause_sandbox(sandbox)
+        except Exception as exc:
+            logger.warning(f"[E2B] Failed to pause warm sandbox {sandbox_id}, discarding it: {exc}")
+            await self._kill_sandbox_quietly(sandbox_id, sandbox=sandbox)
+            return None
+
+        logger.info(f"[E2B] Warm sandbox {sandbox_id} ready (template={template or 'default'})")
+        return {"sandbox_id": sandbox_id, "created_at": time.time()}
+
+    async def _kill_sandbox_quietly(self, sandbox_id: str, sandbox=None):
+        try:
+            if sandbox is not None:
+                await asyncio.wait_for(sandbox.kill(), timeout=10)
+            elif AsyncSandbox is not None:
+                proxy = str(self.config.get("proxy", DEFAULT_PROXY) or "").strip()
+                await self._call_sandbox_entrypoint(
+                    AsyncSandbox.kill,
+                    {
+                        "sandbox_id": sandbox_id,
+                        "api_key": self.config.get("e2b_api_key", ""),
+                        "proxy": proxy or None,
+                    },
+                    call_timeout=10,
+                    action_name="kill",
+                )
+        except Exception as exc:
+            logger.warning(f"[E2B] Failed to kill sandbox {sandbox_id}: {exc}")
+        self._sandbox_handles.invalidate(sandbox_id)
+
     @filter.on_llm_request()
     async def inject_file_hint(self, event: AstrMessageEvent, req: ProviderRequest):
         denied_message = self._get_user_access_denied_message(event)
@@ -1017,7 +3397,9 @@ class Main(star.Star):
             "By default e2b_sandbox_run_python_code auto-pauses the sandbox after execution; only pass auto_pause=false when you intentionally need the sandbox to keep running. "
             "Do not change template mid-session without killing the old sandbox first. Do not use top-level return in Python scripts. "
             "Do not use send_message_to_user to send sandbox file paths such as /home/user/... . "
-            "When code generates files, this plugin caches candidate files and you should call e2b_sandbox_list_files and e2b_sandbox_send_file to deliver the right one to the user."
+            "When code generates files, this plugin caches candidate files and you should call e2b_sandbox_list_files and e2b_sandbox_send_file to deliver the right one to the user. "
+            "When a run result says its output was truncated, call e2b_sandbox_read_output to page through the saved output instead of re-running the code. "
+            "For long-running work such as training or large scraping jobs, use e2b_sandbox_submit_job and check it later with e2b_sandbox_job_status instead of blocking on e2b_sandbox_run_python_code."
         )
 
         pending_files = self._get_pending_files(event)
@@ -1081,12 +3463,42 @@ class Main(star.Star):
             action_name="create",
         )
 
-    async def _install_dependencies(self, sandbox, packages):
-        install_cmd = (
-            "python -m pip install --disable-pip-version-check --no-input "
-            + " ".join(packages)
-        )
+    async def _install_dependencies(self, session_id: str, sandbox, packages):
+        ledger = await self._get_package_ledger(session_id, sandbox)
+        if ledger is not None:
+            importable = set(ledger.get("importable", []))
+            packages = [
+                package
+                for package in packages
+                if PACKAGE_IMPORT_MAP.get(package, package) not in importable
+            ]
+            if not packages:
+                return
+
         logger.info(f"[E2B] Auto-installing dependencies: {packages}")
+        installer = (ledger or {}).get("installer", "pip")
+        if installer == "uv":
+            try:
+                await self._run_install_command(
+                    sandbox,
+                    "uv pip install --system --python python --quiet " + " ".join(packages),
+                )
+            except Exception as exc:
+                logger.warning(f"[E2B] uv install failed, falling back to pip: {exc}")
+                installer = "pip"
+        if installer != "uv":
+            await self._run_install_command(
+                sandbox,
+                "python -m pip install --disable-pip-version-check --no-input " + " ".join(packages),
+            )
+
+        if ledger is not None:
+            ledger["importable"] = sorted(
+                importable | {PACKAGE_IMPORT_MAP.get(package, package) for package in packages}
+            )
+            self._persist_sandbox_session(session_id)
+
+    async def _run_install_command(self, sandbox, install_cmd: str):
         install_result = await sandbox.commands.run(install_cmd, timeout=180)
 
         exit_code = getattr(install_result, "exit_code", 0)
@@ -1094,40 +3506,222 @@ class Main(star.Star):
             stderr_text = getattr(install_result, "stderr", "") or getattr(install_result, "stdout", "")
             raise RuntimeError(f"Dependency installation failed: {stderr_text}".strip())
 
-    async def _stage_pending_files(self, event: AstrMessageEvent, sandbox, pending_files):
-        uploaded_paths = []
-        await sandbox.commands.run(f"mkdir -p {DEFAULT_UPLOAD_DIR}", timeout=30)
+    async def _get_package_ledger(self, session_id: str, sandbox):
+        sandbox_meta = self.sandbox_sessions.get(session_id)
+        if not sandbox_meta:
+            return None
+        ledger = sandbox_meta.get("packages")
+        if isinstance(ledger, dict):
+            return ledger
+
+        try:
+            result = await self._run_sandbox_helper(
+                sandbox,
+                "probe_packages",
+                {"modules": sorted(IMPORT_PACKAGE_MAP)},
+            )
+        except Exception as exc:
+            logger.warning(f"[E2B] Package probe failed, installing detected packages directly: {exc}")
+            return None
+
+        ledger = {
+            "importable": sorted(result.get("importable") or []),
+            "installer": result.get("installer") or "pip",
+        }
+        sandbox_meta["packages"] = ledger
+        self._persist_sandbox_session(session_id)
+        logger.info(f"[E2B] Sandbox package ledger initialized: {ledger}")
+        return ledger
+
+    async def _stage_pending_files(self, event: AstrMessageEvent, session_id: str, sandbox, pending_files):
+        sandbox_meta = self.sandbox_sessions.get(session_id)
+        if sandbox_meta is None:
+            sandbox_meta = {}
+        uploads = dict(sandbox_meta.get("uploads") or {})
+
+        upload_keys = []
+        expected = {}
         for file_meta in pending_files:
-            file_payload = await self._resolve_file_payload(event, file_meta)
-            if not file_payload:
+            upload_key, name = self._get_upload_key(file_meta)
+            known_path = self._resolve_remote_path(name) if upload_key else None
+            upload_keys.append((upload_key, known_path))
+            entry = uploads.get(known_path) if known_path else None
+            if entry and entry.get("key") == upload_key:
+                expected[known_path] = entry
+        verified = await self._verify_uploaded_files(sandbox, expected)
+
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+        budget = UploadBudget(MAX_UPLOAD_TOTAL_MB * 1024 * 1024)
+
+        async def stage(file_meta, upload_key, known_path):
+            if known_path in verified:
+                return known_path, None
+            timeout = self._get_upload_file_timeout(file_meta)
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        self._stage_pending_file(
+                            event, sandbox, file_meta, upload_key, uploads, budget
+                        ),
+                        timeout=timeout,
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning(
+                        f"[E2B] Timed out staging {file_meta.get('name') or file_meta} "
+                        f"after {timeout}s"
+                    )
+                except Exception as exc:
+                    logger.warning(f"[E2B] Failed to stage {file_meta.get('name') or file_meta}: {exc}")
+                return None, None
+
+        results = await asyncio.gather(
+            *(
+                stage(file_meta, upload_key, known_path)
+                for file_meta, (upload_key, known_path) in zip(pending_files, upload_keys)
+            )
+        )
+
+        uploaded_paths = []
+        changed = False
+        for remote_path, entry in results:
+            if not remote_path:
                 continue
+            uploaded_paths.append(remote_path)
+            if entry is not None and uploads.get(remote_path) != entry:
+                uploads[remote_path] = entry
+                changed = True
+
+        if verified:
+            logger.info(f"[E2B] Reused {len(verified)} uploaded file(s) already in the sandbox")
+        if changed and session_id in self.sandbox_sessions:
+            sandbox_meta["uploads"] = uploads
+            self._persist_sandbox_session(session_id)
+        return uploaded_paths
+
+    async def _stage_pending_file(self, event: AstrMessageEvent, sandbox, file_meta, upload_key, uploads, budget):
+        display_name = file_meta.get("name") or file_meta
+        max_file_bytes = self._get_max_upload_file_bytes()
+        declared_size = self._safe_int(file_meta.get("file_size"), 0, minimum=0)
+        if declared_size > max_file_bytes:
+            logger.warning(
+                f"[E2B] Rejected {display_name}: {declared_size} bytes exceeds the per-file upload limit"
+            )
+            return None, None
+        if declared_size > budget.remaining:
+            logger.warning(
+                f"[E2B] Skipped {display_name}: upload budget of {MAX_UPLOAD_TOTAL_MB}MB exceeded"
+            )
+            return None, None
+
+        # The payload's bytes are charged to the budget while it is resolved.
+        file_payload = await self._resolve_file_payload(
+            event, file_meta, min(max_file_bytes, budget.remaining), budget
+        )
+        if not file_payload:
+            return None, None
 
+        try:
             remote_path = self._resolve_remote_path(file_payload["name"])
-            await sandbox.files.write(remote_path, file_payload["content"])
-            uploaded_paths.append(remote_path)
+            entry = {
+                "key": upload_key,
+                "size": file_payload["size"],
+                "md5": file_payload["md5"],
+            }
+            previous = uploads.get(remote_path) or {}
+            if (
+                previous.get("md5") == entry["md5"]
+                and previous.get("size") == entry["size"]
+                and remote_path in await self._verify_uploaded_files(sandbox, {remote_path: entry})
+            ):
+                logger.info(f"[E2B] Skipped unchanged upload: {remote_path}")
+            else:
+                with open(file_payload["path"], "rb") as file_obj:
+                    await sandbox.files.write(remote_path, file_obj)
+            return remote_path, entry
+        finally:
+            if file_payload.get("temporary"):
+                self._remove_file_quietly(file_payload["path"])
+
+    def _get_max_upload_file_bytes(self):
+        return self._safe_int(
+            self.config.get("max_upload_file_size_mb"),
+            DEFAULT_MAX_UPLOAD_FILE_SIZE_MB,
+            minimum=1,
+            maximum=MAX_UPLOAD_TOTAL_MB,
+        ) * 1024 * 1024
 
-        return uploaded_paths
+    def _get_upload_file_timeout(self, file_meta):
+        # Staging covers both the download and the sandbox upload, so budget time for the
+        # declared size (or the per-file cap when the size is unknown) at a slow link speed.
+        max_file_bytes = self._get_max_upload_file_bytes()
+        size = self._safe_int(file_meta.get("file_size"), 0, minimum=0) or max_file_bytes
+        size = min(size, max_file_bytes)
+        return UPLOAD_FILE_TIMEOUT_SECONDS + 2 * size // UPLOAD_MIN_BYTES_PER_SECOND
+
+    def _get_upload_key(self, file_meta):
+        source = self._extract_local_source(file_meta)
+        if source:
+            try:
+                stat_result = os.stat(source)
+            except OSError:
+                return None, None
+            name = file_meta.get("name") or os.path.basename(source)
+            return f"local:{os.path.abspath(source)}:{stat_result.st_size}:{stat_result.st_mtime_ns}", name
+
+        name = file_meta.get("name")
+        if not name:
+            return None, None
+        file_id = file_meta.get("file_id") or file_meta.get("file")
+        if file_id and file_meta.get("file_size"):
+            return f"id:{file_id}:{file_meta['file_size']}", name
+        return None, None
+
+    async def _verify_uploaded_files(self, sandbox, expected):
+        if not expected:
+            return set()
+        try:
+            result = await self._run_sandbox_helper(
+                sandbox,
+                "verify",
+                {
+                    "files": {
+                        path: {"size": entry.get("size"), "md5": entry.get("md5")}
+                        for path, entry in expected.items()
+                    }
+                },
+            )
+        except Exception as exc:
+            logger.info(f"[E2B] Upload verification failed, re-uploading files: {exc}")
+            return set()
+        return set(result.get("verified") or [])
 
-    async def _resolve_file_payload(self, event: AstrMessageEvent, file_meta):
+    async def _resolve_file_payload(
+        self, event: AstrMessageEvent, file_meta, max_bytes: int, budget: UploadBudget = None
+    ):
         source = self._extract_local_source(file_meta)
         if source and os.path.exists(source):
-            content = await asyncio.to_thread(self._read_local_file, source)
-            return {"name": file_meta.get("name") or os.path.basename(source), "content": content}
+            payload = await self._describe_local_payload(source, max_bytes, budget)
+            if payload is not None:
+                payload["name"] = file_meta.get("name") or os.path.basename(source)
+            return payload
 
         file_url = self._extract_remote_url(file_meta)
         if file_url:
-            content = await asyncio.to_thread(self._download_url, file_url)
-            if content is not None:
-                return {"name": file_meta.get("name") or "attachment.bin", "content": content}
+            payload = await self._download_url_to_file(file_url, max_bytes, budget)
+            if payload is not None:
+                payload["name"] = file_meta.get("name") or "attachment.bin"
+                return payload
 
         fallback_url = await self._get_file_url_from_bot(event, file_meta)
         if fallback_url:
             if os.path.exists(fallback_url):
-                content = await asyncio.to_thread(self._read_local_file, fallback_url)
+                payload = await self._describe_local_payload(fallback_url, max_bytes, budget)
             else:
-                content = await asyncio.to_thread(self._download_url, fallback_url)
-            if content is not None:
-                return {"name": file_meta.get("name") or "attachment.bin", "content": content}
+                payload = await self._download_url_to_file(fallback_url, max_bytes, budget)
+            if payload is not None:
+                payload["name"] = file_meta.get("name") or "attachment.bin"
+                return payload
+            self._file_url_cache.pop(self._get_file_url_cache_key(file_meta), None)
 
         logger.warning(
             f"[E2B] Failed to resolve file payload for {file_meta.get('name') or file_meta}"
@@ -1137,49 +3731,84 @@ class Main(star.Star):
     async def _get_file_url_from_bot(self, event: AstrMessageEvent, file_meta):
         file_id = file_meta.get("file_id")
         file_token = file_meta.get("file")
+        cache_key = self._get_file_url_cache_key(file_meta)
+        cached = self._file_url_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            value, expires_at = cached
+            if expires_at > time.time() and self._is_usable_file_source(value):
+                self._file_url_cache.move_to_end(cache_key)
+                return value
+            self._file_url_cache.pop(cache_key, None)
 
+        requests = []
         if file_meta.get("group_id") and file_id and file_meta.get("busid") is not None:
-            response = await self._call_bot_api(
-                event,
-                "get_group_file_url",
-                {
-                    "group_id": file_meta["group_id"],
-                    "file_id": file_id,
-                    "busid": file_meta["busid"],
-                },
+            requests.append(
+                (
+                    "get_group_file_url",
+                    {
+                        "group_id": file_meta["group_id"],
+                        "file_id": file_id,
+                        "busid": file_meta["busid"],
+                    },
+                )
             )
-            extracted = self._extract_url_or_path(response)
-            if extracted:
-                return extracted
-
         if file_meta.get("user_id") and (file_id or file_token):
-            response = await self._call_bot_api(
-                event,
-                "get_private_file_url",
-                {
-                    "user_id": file_meta["user_id"],
-                    "file_id": file_id,
-                    "file": file_token,
-                },
+            requests.append(
+                (
+                    "get_private_file_url",
+                    {
+                        "user_id": file_meta["user_id"],
+                        "file_id": file_id,
+                        "file": file_token,
+                    },
+                )
             )
-            extracted = self._extract_url_or_path(response)
-            if extracted:
-                return extracted
-
         if file_token or file_id:
-            response = await self._call_bot_api(
-                event,
-                "get_file",
-                {
-                    "file": file_token or file_id,
-                    "type": "file",
-                },
+            requests.append(
+                (
+                    "get_file",
+                    {
+                        "file": file_token or file_id,
+                        "type": "file",
+                    },
+                )
             )
-            extracted = self._extract_url_or_path(response)
-            if extracted:
-                return extracted
+        if not requests:
+            return None
 
-        return None
+        async def resolve(action, params):
+            value = self._extract_url_or_path(await self._call_bot_api(event, action, params))
+            if value and not self._is_usable_file_source(value):
+                logger.info(f"[E2B] Ignored unusable {action} result for {file_meta.get('name') or file_id}: {value}")
+                return None
+            return value
+
+        tasks = [asyncio.create_task(resolve(action, params)) for action, params in requests]
+        extracted = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                extracted = await next_done
+                if extracted:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if extracted and cache_key:
+            self._file_url_cache[cache_key] = (extracted, time.time() + FILE_URL_CACHE_TTL_SECONDS)
+            self._file_url_cache.move_to_end(cache_key)
+            while len(self._file_url_cache) > MAX_FILE_URL_CACHE_SIZE:
+                self._file_url_cache.popitem(last=False)
+        return extracted
+
+    def _is_usable_file_source(self, value: str):
+        return value.startswith(("http://", "https://")) or os.path.exists(value)
+
+    def _get_file_url_cache_key(self, file_meta):
+        file_key = file_meta.get("file_id") or file_meta.get("file")
+        if not file_key:
+            return None
+        return (str(file_key), str(file_meta.get("group_id") or ""), str(file_meta.get("user_id") or ""))
 
     async def _call_bot_api(self, event: AstrMessageEvent, action: str, params: dict):
         bot = getattr(event, "bot", None)
@@ -1187,6 +3816,17 @@ class Main(star.Star):
             logger.warning(f"[E2B] event.bot is unavailable; cannot call {action}")
             return None
 
+        cached = self._bot_api_callers.get(id(bot))
+        if cached is not None and cached[0] is bot:
+            _, method, uses_kwargs = cached
+            try:
+                return await self._invoke_bot_api(method, action, params, uses_kwargs)
+            except TypeError:
+                self._bot_api_callers.pop(id(bot), None)
+            except Exception as exc:
+                logger.warning(f"[E2B] Bot API call {action} failed: {exc}")
+                return None
+
         candidates = [
             getattr(bot, "call_action", None),
             getattr(bot, "call_api", None),
@@ -1205,14 +3845,10 @@ class Main(star.Star):
             if not callable(method):
                 continue
 
-            for args, kwargs in (
-                ((action,), params),
-                ((action, params), {}),
-            ):
+            for uses_kwargs in (True, False):
                 try:
-                    result = method(*args, **{k: v for k, v in kwargs.items() if v is not None})
-                    if inspect.isawaitable(result):
-                        result = await result
+                    result = await self._invoke_bot_api(method, action, params, uses_kwargs)
+                    self._bot_api_callers[id(bot)] = (bot, method, uses_kwargs)
                     return result
                 except TypeError:
                     continue
@@ -1223,46 +3859,125 @@ class Main(star.Star):
         logger.warning(f"[E2B] No compatible bot API caller found for {action}")
         return None
 
-    async def _handle_images(self, event: AstrMessageEvent, execution, streamed_results):
-        has_sent_image = False
-        results = list(getattr(execution, "results", []) or [])
-        if not results and streamed_results:
-            results = streamed_results
+    async def _invoke_bot_api(self, method, action: str, params: dict, uses_kwargs: bool):
+        if uses_kwargs:
+            result = method(action, **{k: v for k, v in params.items() if v is not None})
+        else:
+            result = method(action, params)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
 
-        for res in results:
-            img_data, img_ext = self._extract_image_data(res)
-            if not img_data:
-                continue
+    async def _handle_images(self, image_dispatcher: ImageDispatcher, execution):
+        results = getattr(execution, "results", None)
+        for res in list(results or []):
+            image_dispatcher.submit(res)
+        if isinstance(results, list):
+            results.clear()
+        return await image_dispatcher.finish(IMAGE_DISPATCH_WAIT_SECONDS)
+
+    def _get_max_images_per_execution(self):
+        return self._safe_int(
+            self.config.get("max_images_per_execution"),
+            DEFAULT_MAX_IMAGES_PER_EXECUTION,
+            minimum=0,
+            maximum=MAX_IMAGES_PER_EXECUTION,
+        )
 
-            try:
-                img_bytes = base64.b64decode(img_data)
-            except Exception as exc:
-                logger.error(f"[E2B] Image preparation failed: {exc}")
-                continue
+    def _decode_image(self, img_data):
+        img_bytes = base64.b64decode(img_data)
+        return img_bytes, hashlib.sha256(img_bytes).hexdigest()
 
-            async def send_image_task(data, ext, evt):
-                tmp_path = None
-                try:
-                    await asyncio.sleep(0.3)
-                    with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp_file:
-                        tmp_file.write(data)
-                        tmp_path = tmp_file.name
-                    await evt.send(evt.chain_result([Image.fromFileSystem(tmp_path)]))
-                    logger.info("[E2B] Async image sent successfully.")
-                except Exception as exc:
-                    logger.error(f"[E2B] Async image send failed: {exc}")
-                finally:
-                    if tmp_path and os.path.exists(tmp_path):
-                        try:
-                            os.remove(tmp_path)
-                        except Exception:
-                            pass
+    def _get_image_limits(self):
+        max_dimension = self._safe_int(
+            self.config.get("image_max_dimension"),
+            DEFAULT_IMAGE_MAX_DIMENSION,
+            minimum=0,
+        )
+        if max_dimension:
+            max_dimension = max(max_dimension, MIN_IMAGE_DIMENSION)
+        max_size_kb = self._safe_int(
+            self.config.get("image_max_size_kb"),
+            DEFAULT_IMAGE_MAX_SIZE_KB,
+            minimum=0,
+        )
+        return max_dimension, max_size_kb * 1024
 
-            asyncio.create_task(send_image_task(img_bytes, img_ext, event))
-            has_sent_image = True
-            break
+    def _render_image_file(self, img_bytes: bytes, img_ext: str, max_dimension: int, max_bytes: int):
+        try:
+            img_bytes, img_ext = self._optimize_image(img_bytes, img_ext, max_dimension, max_bytes)
+        except Exception as exc:
+            logger.warning(f"[E2B] Image optimization failed, sending original: {exc}")
+        return self._write_image_file(img_bytes, img_ext)
+
+    def _optimize_image(self, img_bytes: bytes, img_ext: str, max_dimension: int, max_bytes: int):
+        if img_ext == ".svg":
+            if cairosvg is not None:
+                img_bytes, img_ext = cairosvg.svg2png(bytestring=img_bytes, scale=SVG_RASTER_SCALE), ".png"
+            elif not self._svg_warned:
+                self._svg_warned = True
+                logger.warning(
+                    "[E2B] cairosvg is not installed; SVG images are sent as-is and may not display in "
+                    "chat clients. Install the optional dependency with `pip install cairosvg`."
+                )
+        if PILImage is None or img_ext == ".svg" or not (max_dimension or max_bytes):
+            return img_bytes, img_ext
+
+        original_size = len(img_bytes)
+        with PILImage.open(BytesIO(img_bytes)) as image:
+            image.load()
+            source_format = image.format if image.format in IMAGE_FORMAT_EXTENSIONS else "PNG"
+            resized = False
+            if max_dimension and max(image.size) > max_dimension:
+                image.thumbnail((max_dimension, max_dimension), PILImage.LANCZOS)
+                resized = True
+
+            while True:
+                if resized:
+                    img_bytes, img_ext = self._encode_image(image, source_format)
+                if not max_bytes or len(img_bytes) <= max_bytes:
+                    break
+                for image_format in ("JPEG", "WEBP"):
+                    if image_format == source_format:
+                        continue
+                    try:
+                        candidate = self._encode_image(image, image_format)
+                    except (KeyError, OSError, ValueError):
+                        continue
+                    if len(candidate[0]) < len(img_bytes):
+                        img_bytes, img_ext = candidate
+                if len(img_bytes) <= max_bytes or max(image.size) <= MIN_IMAGE_DIMENSION:
+                    break
+                image = image.resize(
+                    (
+                        max(1, int(image.width * IMAGE_SHRINK_FACTOR)),
+                        max(1, int(image.height * IMAGE_SHRINK_FACTOR)),
+                    ),
+                    PILImage.LANCZOS,
+                )
+                resized = True
 
-        return has_sent_image
+            if len(img_bytes) != original_size:
+                logger.info(
+                    f"[E2B] Image optimized to {image.width}x{image.height} {img_ext}: "
+                    f"{original_size} -> {len(img_bytes)} bytes"
+                )
+        return img_bytes, img_ext
+
+    def _encode_image(self, image, image_format: str):
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            background = PILImage.new("RGB", image.size, "white")
+            rgba = image.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            image = background
+        buffer = BytesIO()
+        image.save(buffer, image_format, quality=IMAGE_REENCODE_QUALITY)
+        return buffer.getvalue(), IMAGE_FORMAT_EXTENSIONS[image_format]
+
+    def _write_image_file(self, img_bytes: bytes, img_ext: str):
+        with tempfile.NamedTemporaryFile(suffix=img_ext, delete=False) as tmp_file:
+            tmp_file.write(img_bytes)
+            return tmp_file.name
 
     async def _handle_generated_files(
         self,
@@ -1272,8 +3987,7 @@ class Main(star.Star):
         hint_texts,
         before_snapshot,
     ):
-        self._cleanup_export_cache()
-        self._cleanup_session_cache()
+        await asyncio.to_thread(self._cleanup_export_cache)
 
         session_id = self._get_session_id(event)
         generated_files = await self._collect_generated_files(
@@ -1287,21 +4001,22 @@ class Main(star.Star):
             self.generated_files[session_id] = []
             return []
 
-        cached_files = []
-        for file_name, file_bytes, remote_path, file_size, signature in generated_files:
-            local_path = self._write_export_file(file_name, file_bytes)
-            if not local_path:
-                continue
-
-            cached_files.append(
+        if self.config.get("lazy_file_download", False):
+            sandbox_id = self._extract_sandbox_id(sandbox)
+            cached_files = [
                 {
-                    "name": local_path.name,
-                    "local_path": str(local_path.resolve()),
-                    "remote_path": remote_path,
-                    "size": file_size,
-                    "signature": signature,
+                    "name": candidate["name"],
+                    "local_path": "",
+                    "remote_path": candidate["remote_path"],
+                    "size": candidate["size"],
+                    "signature": candidate["signature"],
+                    "md5": candidate["md5"],
+                    "sandbox_id": sandbox_id,
                 }
-            )
+                for candidate in generated_files
+            ]
+        else:
+            cached_files = await self._download_generated_files(sandbox, session_id, generated_files)
 
         self.generated_files[session_id] = cached_files
         if not cached_files:
@@ -1309,8 +4024,36 @@ class Main(star.Star):
 
         return [file_meta["name"] for file_meta in cached_files]
 
-    def _build_execution_code(self, code_to_run: str) -> str:
-        setup_code = """
+    def _needs_plot_setup(self, session_id: str, code: str, packages):
+        sandbox_meta = self.sandbox_sessions.get(session_id) or {}
+        if sandbox_meta.get("plot_ready"):
+            return False
+        if {"matplotlib", "seaborn", "wordcloud"} & set(packages):
+            return True
+        return bool(PLOT_CODE_PATTERN.search(code))
+
+    async def _upload_plot_font(self, sandbox):
+        font_path = self._plugin_data_dir / "fonts" / PLOT_FONT_NAME
+        if not font_path.is_file():
+            if not self._plot_font_warned:
+                self._plot_font_warned = True
+                logger.warning(
+                    f"[E2B] Plot font {PLOT_FONT_NAME} not found at {font_path}; Chinese labels in charts "
+                    "will render as boxes. Place the font file there to enable Chinese plotting."
+                )
+            return
+
+        try:
+            content = await asyncio.to_thread(self._read_local_file, str(font_path))
+            await sandbox.files.write(SANDBOX_PLOT_FONT_PATH, content)
+        except Exception as exc:
+            logger.warning(f"[E2B] Failed to upload plot font: {exc}")
+
+    def _build_execution_code(self, code_to_run: str, plot_setup: bool = False) -> str:
+        if not plot_setup:
+            return code_to_run
+
+        setup_code = f"""
 import os
 import matplotlib
 matplotlib.use('Agg')
@@ -1318,13 +4061,7 @@ import matplotlib.pyplot as plt
 import matplotlib.font_manager as fm
 
 def _configure_font():
-    font_path = '/tmp/SimHei.ttf'
-    if not os.path.exists(font_path):
-        try:
-            os.system('curl -Ls -o /tmp/SimHei.ttf https://github.com/StellarCN/scp_zh/raw/master/fonts/SimHei.ttf > /dev/null 2>&1')
-        except Exception:
-            pass
-
+    font_path = '{SANDBOX_PLOT_FONT_PATH}'
     if os.path.exists(font_path):
         try:
             fm.fontManager.addfont(font_path)
@@ -1573,19 +4310,22 @@ except Exception:
 
         return sorted(packages)
 
-    def _extract_text_result(self, execution, streamed_results):
+    def _extract_text_result(self, execution, streamed_results, output_limit: int, spool: OutputSpool = None):
+        capture = self._new_output_capture(output_limit, spool, "result")
         text = getattr(execution, "text", None)
         if text:
-            return str(text)
+            capture.write(str(text))
+            return capture
 
-        result_texts = []
         results = list(getattr(execution, "results", []) or []) or list(streamed_results)
+        separator = ""
         for result in results:
             text_value = getattr(result, "text", None)
             if text_value:
-                result_texts.append(str(text_value))
+                capture.write(separator + str(text_value))
+                separator = "\n"
 
-        return "\n".join(result_texts).strip()
+        return capture
 
     async def _collect_generated_files(
         self,
@@ -1596,7 +4336,19 @@ except Exception:
         before_snapshot,
     ):
         input_names = {self._basename(meta.get("name", "")) for meta in pending_files}
-        after_snapshot = await self._snapshot_sandbox_files(sandbox)
+        hint_paths = self._extract_paths_from_texts(hint_texts)
+        max_bytes = self._safe_int(
+            self.config.get("max_return_file_size_mb"),
+            DEFAULT_MAX_RETURN_FILE_SIZE_MB,
+            minimum=1,
+            maximum=50,
+        ) * 1024 * 1024
+        after_snapshot, remote_files = await self._collect_sandbox_changes(
+            sandbox,
+            hint_paths,
+            input_names,
+            max_bytes,
+        )
         generated_paths = []
         seen_paths = set()
 
@@ -1613,7 +4365,7 @@ except Exception:
                 seen_paths.add(remote_path)
 
         if not generated_paths:
-            for remote_path in self._extract_paths_from_texts(hint_texts):
+            for remote_path in hint_paths:
                 if remote_path in seen_paths:
                     continue
                 if self._basename(remote_path) in input_names:
@@ -1626,24 +4378,11 @@ except Exception:
         if not generated_paths:
             return []
 
-        max_bytes = self._safe_int(
-            self.config.get("max_return_file_size_mb"),
-            DEFAULT_MAX_RETURN_FILE_SIZE_MB,
-            minimum=1,
-            maximum=50,
-        ) * 1024 * 1024
-
         candidates = []
         for remote_path in generated_paths:
             file_name = self._basename(remote_path)
-            stat_result = await sandbox.commands.run(
-                f"stat -c %s {shlex_quote(remote_path)}",
-                timeout=15,
-            )
-            file_size = self._parse_int_output(stat_result)
-            if file_size is None:
-                logger.warning(f"[E2B] Failed to stat generated file: {remote_path}")
-                continue
+            file_info = remote_files.get(remote_path, {})
+            file_size = file_info.get("size", after_snapshot[remote_path]["size"])
             if file_size <= 0:
                 logger.info(f"[E2B] Skip generated file {file_name}: empty file")
                 continue
@@ -1653,21 +4392,8 @@ except Exception:
                 )
                 continue
 
-            try:
-                content = await self._read_sandbox_file_bytes(sandbox, remote_path)
-            except Exception as exc:
-                logger.warning(f"[E2B] Failed to download generated file {remote_path}: {exc}")
-                continue
-
-            if not content:
-                logger.info(f"[E2B] Skip generated file {file_name}: downloaded content is empty")
-                continue
-            if not self._is_valid_generated_file(file_name, content):
-                logger.warning(f"[E2B] Skip generated file {file_name}: integrity validation failed")
-                continue
-
-            signature = self._build_file_signature(file_name, content)
-            if signature in self.sent_file_signatures[session_id]:
+            signature = f"{file_name}:{file_info['md5']}" if file_info.get("md5") else ""
+            if signature and signature in self.sent_file_signatures[session_id]:
                 logger.info(f"[E2B] Skip generated file {file_name}: duplicate in current session")
                 continue
 
@@ -1679,21 +4405,145 @@ except Exception:
                 before_snapshot,
                 after_snapshot,
             )
-            candidates.append((score, file_name, content, remote_path, file_size, signature))
+            candidates.append(
+                {
+                    "score": score,
+                    "name": file_name,
+                    "remote_path": remote_path,
+                    "size": file_size,
+                    "md5": file_info.get("md5", ""),
+                    "signature": signature,
+                }
+            )
 
         if not candidates:
             return []
 
-        candidates.sort(key=lambda item: item[0], reverse=True)
+        candidates.sort(key=lambda item: item["score"], reverse=True)
         selected_candidates = candidates[:MAX_GENERATED_FILE_CANDIDATES]
         logger.info(
             "[E2B] Cached generated file candidates: "
-            + ", ".join(f"{item[1]} (score={item[0]})" for item in selected_candidates)
+            + ", ".join(f"{item['name']} (score={item['score']})" for item in selected_candidates)
+        )
+        return selected_candidates
+
+    async def _fetch_generated_file_contents(self, sandbox, candidates):
+        contents = {}
+        remote_paths = [candidate["remote_path"] for candidate in candidates]
+        try:
+            result = await self._run_sandbox_helper(sandbox, "fetch", {"paths": remote_paths}, timeout=60)
+            for remote_path, info in (result.get("files") or {}).items():
+                if isinstance(info, dict) and info.get("content") is not None:
+                    contents[remote_path] = (py_base64.b64decode(info["content"]), info.get("md5", ""))
+        except Exception as exc:
+            logger.warning(f"[E2B] Sandbox helper fetch failed, falling back to per-file reads: {exc}")
+
+        for remote_path in remote_paths:
+            if remote_path in contents:
+                continue
+            try:
+                content = await self._read_sandbox_file_bytes(sandbox, remote_path)
+            except Exception as exc:
+                logger.warning(f"[E2B] Failed to download generated file {remote_path}: {exc}")
+                continue
+            contents[remote_path] = (content, "")
+        return contents
+
+    async def _download_generated_files(self, sandbox, session_id, candidates, keep_duplicates: bool = False):
+        streamed_results = await asyncio.gather(
+            *(self._stream_generated_file(sandbox, candidate) for candidate in candidates)
         )
-        return [
-            (file_name, content, remote_path, file_size, signature)
-            for _score, file_name, content, remote_path, file_size, signature in selected_candidates
+        fallback_candidates = [
+            candidate
+            for candidate, streamed in zip(candidates, streamed_results)
+            if streamed is None
         ]
+        fallback_contents = {}
+        if fallback_candidates:
+            fallback_contents = await self._fetch_generated_file_contents(sandbox, fallback_candidates)
+
+        downloaded = []
+        for candidate, streamed in zip(candidates, streamed_results):
+            file_name = candidate["name"]
+            if streamed is None:
+                content, md5 = fallback_contents.get(candidate["remote_path"], (b"", ""))
+                if not content:
+                    logger.info(f"[E2B] Skip generated file {file_name}: downloaded content is empty")
+                    continue
+                local_path = await asyncio.to_thread(self._write_export_file, file_name, content)
+                if not local_path:
+                    continue
+                file_size = len(content)
+                signature = f"{file_name}:{md5}" if md5 else self._build_file_signature(file_name, content)
+            else:
+                local_path, file_size, md5 = streamed
+                signature = f"{file_name}:{md5}"
+
+            if not await asyncio.to_thread(self._is_valid_generated_file, file_name, local_path):
+                logger.warning(f"[E2B] Skip generated file {file_name}: integrity validation failed")
+                local_path.unlink(missing_ok=True)
+                continue
+            if not keep_duplicates and signature in self.sent_file_signatures[session_id]:
+                logger.info(f"[E2B] Skip generated file {file_name}: duplicate in current session")
+                local_path.unlink(missing_ok=True)
+                continue
+
+            downloaded.append(
+                {
+                    "name": local_path.name,
+                    "local_path": str(local_path.resolve()),
+                    "remote_path": candidate["remote_path"],
+                    "size": file_size,
+                    "signature": signature,
+                }
+            )
+        return downloaded
+
+    async def _stream_generated_file(self, sandbox, candidate):
+        files_api = getattr(sandbox, "files", None)
+        if files_api is None or not hasattr(files_api, "read"):
+            return None
+
+        target = None
+        temp_path = None
+        try:
+            stream = await files_api.read(candidate["remote_path"], format="stream")
+            if not hasattr(stream, "__aiter__"):
+                return None
+
+            target = await asyncio.to_thread(self._reserve_export_path, candidate["name"])
+            temp_path = target.with_name(target.name + ".part")
+            digest = hashlib.md5()
+            written = 0
+            file_obj = await asyncio.to_thread(open, temp_path, "wb")
+            try:
+                async for chunk in stream:
+                    if not chunk:
+                        continue
+                    written += len(chunk)
+                    if written > candidate["size"]:
+                        raise RuntimeError(f"stream exceeded expected size {candidate['size']}")
+                    digest.update(chunk)
+                    await asyncio.to_thread(file_obj.write, chunk)
+            finally:
+                await asyncio.to_thread(file_obj.close)
+
+            md5 = digest.hexdigest()
+            if written != candidate["size"] or (candidate.get("md5") and md5 != candidate["md5"]):
+                raise RuntimeError(
+                    f"integrity check failed (got {written} bytes, md5 {md5}; "
+                    f"expected {candidate['size']} bytes, md5 {candidate.get('md5') or 'n/a'})"
+                )
+            await asyncio.to_thread(temp_path.replace, target)
+            return target, written, md5
+        except Exception as exc:
+            logger.warning(
+                f"[E2B] Streaming download failed for {candidate['remote_path']}, using fallback: {exc}"
+            )
+            for path in (temp_path, target):
+                if path is not None:
+                    path.unlink(missing_ok=True)
+            return None
 
     def _score_generated_file(self, remote_path, file_name, file_size, hint_texts, before_snapshot, after_snapshot):
         score = 0
@@ -1728,35 +4578,124 @@ except Exception:
         return score
 
     async def _snapshot_sandbox_files(self, sandbox):
+        sandbox_id = self._extract_sandbox_id(sandbox)
+        snapshot_id = uuid.uuid4().hex
+        try:
+            result = await self._run_sandbox_helper(
+                sandbox,
+                "snapshot",
+                {
+                    "snapshot_id": snapshot_id,
+                    "dirs": [DEFAULT_UPLOAD_DIR, DEFAULT_WORK_DIR],
+                    "mkdirs": [DEFAULT_UPLOAD_DIR],
+                },
+            )
+            self._helper_snapshot_ids[sandbox_id] = snapshot_id
+            return self._normalize_manifest(result.get("manifest"))
+        except Exception as exc:
+            logger.warning(f"[E2B] Sandbox helper snapshot failed, falling back to find: {exc}")
+            self._helper_snapshot_ids.pop(sandbox_id, None)
+            return await self._snapshot_sandbox_files_with_find(sandbox)
+
+    async def _discard_snapshot(self, sandbox):
+        snapshot_id = self._helper_snapshot_ids.pop(self._extract_sandbox_id(sandbox), None)
+        if not snapshot_id:
+            return
+        try:
+            await self._run_sandbox_helper(sandbox, "discard_snapshot", {"snapshot_id": snapshot_id}, timeout=10)
+        except Exception as exc:
+            logger.info(f"[E2B] Could not discard sandbox file snapshot: {exc}")
+
+    async def _collect_sandbox_changes(self, sandbox, hint_paths, exclude_names, max_bytes: int):
+        snapshot_id = self._helper_snapshot_ids.pop(self._extract_sandbox_id(sandbox), None)
+        if snapshot_id:
+            try:
+                result = await self._run_sandbox_helper(
+                    sandbox,
+                    "collect",
+                    {
+                        "snapshot_id": snapshot_id,
+                        "dirs": [DEFAULT_UPLOAD_DIR, DEFAULT_WORK_DIR],
+                        "paths": list(hint_paths),
+                        "exclude_names": sorted(exclude_names),
+                        "max_bytes": max_bytes,
+                    },
+                    timeout=60,
+                )
+                remote_files = {
+                    remote_path: info
+                    for remote_path, info in (result.get("files") or {}).items()
+                    if isinstance(info, dict)
+                }
+                return self._normalize_manifest(result.get("manifest")), remote_files
+            except Exception as exc:
+                logger.warning(f"[E2B] Sandbox helper collect failed, falling back to find: {exc}")
+
+        return await self._snapshot_sandbox_files_with_find(sandbox), {}
+
+    async def _snapshot_sandbox_files_with_find(self, sandbox):
+        listing = await sandbox.commands.run(
+            f"mkdir -p {shlex_quote(DEFAULT_UPLOAD_DIR)} && "
+            f"find {shlex_quote(DEFAULT_UPLOAD_DIR)} {shlex_quote(DEFAULT_WORK_DIR)} "
+            "-maxdepth 1 -type f -printf '%p\\t%s\\t%T@\\n'",
+            timeout=30,
+        )
+
         snapshot = {}
-        search_dirs = [DEFAULT_UPLOAD_DIR, DEFAULT_WORK_DIR]
+        for line in self._command_stdout(listing).splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            parts = line.split("\t")
+            if len(parts) != 3:
+                continue
+            remote_path, size_text, mtime_text = parts
+            try:
+                snapshot[remote_path] = {
+                    "size": int(float(size_text)),
+                    "mtime": float(mtime_text),
+                }
+            except (TypeError, ValueError):
+                continue
 
-        for base_dir in search_dirs:
-            listing = await sandbox.commands.run(
-                f"find {shlex_quote(base_dir)} -maxdepth 1 -type f -printf '%p\\t%s\\t%T@\\n'",
-                timeout=30,
-            )
-            stdout = getattr(listing, "stdout", "") or ""
-            if isinstance(stdout, list):
-                stdout = "".join(stdout)
+        return snapshot
 
-            for line in stdout.splitlines():
-                line = line.strip()
-                if not line:
-                    continue
-                parts = line.split("\t")
-                if len(parts) != 3:
-                    continue
-                remote_path, size_text, mtime_text = parts
+    def _normalize_manifest(self, manifest):
+        snapshot = {}
+        for remote_path, meta in (manifest or {}).items():
+            try:
+                snapshot[str(remote_path)] = {
+                    "size": int(meta["size"]),
+                    "mtime": float(meta["mtime"]),
+                }
+            except (KeyError, TypeError, ValueError):
+                continue
+        return snapshot
+
+    async def _run_sandbox_helper(self, sandbox, operation: str, args: dict, timeout: int = 30):
+        command = (
+            f"if [ -f {SANDBOX_HELPER_PATH} ]; then "
+            f"python3 {SANDBOX_HELPER_PATH} {operation} {shlex_quote(json.dumps(args, ensure_ascii=False))}; "
+            f"else echo {SANDBOX_HELPER_MISSING_MARKER}; fi"
+        )
+        for attempt in range(2):
+            result = await sandbox.commands.run(command, timeout=timeout)
+            stdout = self._command_stdout(result).strip()
+            if SANDBOX_HELPER_MISSING_MARKER not in stdout:
                 try:
-                    snapshot[remote_path] = {
-                        "size": int(float(size_text)),
-                        "mtime": float(mtime_text),
-                    }
-                except (TypeError, ValueError):
-                    continue
+                    response = json.loads(stdout)
+                except ValueError as exc:
+                    raise RuntimeError(f"Sandbox helper returned invalid output: {stdout[:200]}") from exc
+                if response.get("version") == SANDBOX_HELPER_VERSION:
+                    if not response.get("ok"):
+                        raise RuntimeError(f"Sandbox helper {operation} failed: {response.get('error')}")
+                    return response.get("result") or {}
 
-        return snapshot
+            if attempt == 0:
+                logger.info("[E2B] Installing sandbox helper script")
+                await sandbox.files.write(SANDBOX_HELPER_PATH, SANDBOX_HELPER_SCRIPT)
+
+        raise RuntimeError("Sandbox helper is unavailable after reinstall.")
 
     def _build_file_signature(self, file_name, content: bytes):
         digest = hashlib.md5(content).hexdigest()
@@ -1849,13 +4788,144 @@ except Exception:
                 attrs[key] = value
         return attrs
 
-    def _download_url(self, url: str):
+    def _get_http_client(self, url: str):
+        if httpx is None:
+            raise RuntimeError("httpx is not installed; cannot download attachments.")
+
+        proxy = str(self.config.get("proxy", DEFAULT_PROXY) or "").strip()
+        host = urllib.parse.urlsplit(url).hostname or ""
+        if host == "localhost":
+            proxy = ""
+        else:
+            try:
+                if ipaddress.ip_address(host).is_loopback:
+                    proxy = ""
+            except ValueError:
+                pass
+
+        client = self._http_clients.get(proxy)
+        if client is None:
+            client = httpx.AsyncClient(
+                proxy=proxy or None,
+                timeout=httpx.Timeout(30, connect=10),
+                limits=httpx.Limits(
+                    max_connections=MAX_CONCURRENT_DOWNLOADS * 2,
+                    max_keepalive_connections=MAX_CONCURRENT_DOWNLOADS,
+                ),
+                follow_redirects=True,
+            )
+            self._http_clients[proxy] = client
+        return client
+
+    async def _download_url_to_file(self, url: str, max_bytes: int, budget: UploadBudget = None):
+        fd, tmp_path = tempfile.mkstemp(prefix="e2b-upload-")
+        charged = 0
         try:
-            with urllib.request.urlopen(url, timeout=30) as response:
-                return response.read()
+            with os.fdopen(fd, "wb") as tmp_file:
+                async with self._download_semaphore:
+                    client = self._get_http_client(url)
+                    digest = hashlib.md5()
+                    size = 0
+                    pending = []
+                    pending_size = 0
+                    for attempt in range(DOWNLOAD_MAX_RESUME_ATTEMPTS + 1):
+                        headers = {"Range": f"bytes={size}-"} if size else {}
+                        try:
+                            async with client.stream("GET", url, headers=headers) as response:
+                                response.raise_for_status()
+                                if size and response.status_code != 206:
+                                    pending, pending_size = [], 0
+                                    await asyncio.to_thread(self._reset_download_file, tmp_file)
+                                    digest = hashlib.md5()
+                                    size = 0
+                                    if budget is not None:
+                                        budget.refund(charged)
+                                    charged = 0
+
+                                remaining = self._safe_int(
+                                    response.headers.get("Content-Length"), 0, minimum=0
+                                )
+                                if size + remaining > max_bytes:
+                                    raise ValueError(f"{size + remaining} bytes exceeds the upload limit")
+                                if budget is not None and remaining > budget.remaining:
+                                    raise ValueError(f"upload budget of {MAX_UPLOAD_TOTAL_MB}MB exceeded")
+
+                                async for chunk in response.aiter_bytes():
+                                    size += len(chunk)
+                                    if size > max_bytes:
+                                        raise ValueError("download exceeds the upload limit")
+                                    if budget is not None:
+                                        if not budget.charge(len(chunk)):
+                                            # Release this download's share before the response closes so
+                                            # concurrent downloads still waiting on chunks can fit.
+                                            budget.refund(charged)
+                                            charged = 0
+                                            raise ValueError(f"upload budget of {MAX_UPLOAD_TOTAL_MB}MB exceeded")
+                                        charged += len(chunk)
+                                    pending.append(chunk)
+                                    pending_size += len(chunk)
+                                    if pending_size >= UPLOAD_CHUNK_SIZE:
+                                        await asyncio.to_thread(
+                                            self._write_download_chunks, tmp_file, digest, pending
+                                        )
+                                        pending, pending_size = [], 0
+                            await asyncio.to_thread(self._write_download_chunks, tmp_file, digest, pending)
+                            break
+                        except httpx.TransportError as exc:
+                            if attempt >= DOWNLOAD_MAX_RESUME_ATTEMPTS:
+                                raise
+                            # The resume offset counts buffered chunks, so write them before the
+                            # next Range request.
+                            await asyncio.to_thread(self._write_download_chunks, tmp_file, digest, pending)
+                            pending, pending_size = [], 0
+                            logger.info(
+                                f"[E2B] Download of {url} interrupted at {size} bytes, resuming: {exc}"
+                            )
+        except asyncio.CancelledError:
+            self._remove_file_quietly(tmp_path)
+            if budget is not None:
+                budget.refund(charged)
+            raise
         except Exception as exc:
             logger.warning(f"[E2B] Failed to download {url}: {exc}")
+            await asyncio.to_thread(self._remove_file_quietly, tmp_path)
+            if budget is not None:
+                budget.refund(charged)
+            return None
+        return {"path": tmp_path, "size": size, "md5": digest.hexdigest(), "temporary": True}
+
+    def _write_download_chunks(self, tmp_file, digest, chunks):
+        for chunk in chunks:
+            digest.update(chunk)
+            tmp_file.write(chunk)
+
+    def _reset_download_file(self, tmp_file):
+        tmp_file.seek(0)
+        tmp_file.truncate()
+
+    async def _describe_local_payload(self, path: str, max_bytes: int, budget: UploadBudget = None):
+        payload = await asyncio.to_thread(self._describe_local_file, path, max_bytes)
+        if payload is not None and budget is not None and not budget.charge(payload["size"]):
+            logger.warning(f"[E2B] Skipped {path}: upload budget of {MAX_UPLOAD_TOTAL_MB}MB exceeded")
+            return None
+        return payload
+
+    def _describe_local_file(self, path: str, max_bytes: int):
+        size = os.path.getsize(path)
+        if size > max_bytes:
+            logger.warning(f"[E2B] Rejected {path}: {size} bytes exceeds the upload limit")
             return None
+        digest = hashlib.md5()
+        with open(path, "rb") as file_obj:
+            for chunk in iter(lambda: file_obj.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return {"path": path, "size": size, "md5": digest.hexdigest(), "temporary": False}
+
+    def _remove_file_quietly(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
     async def _read_sandbox_file_bytes(self, sandbox, remote_path: str):
         command = (
@@ -1884,7 +4954,7 @@ except Exception:
         with open(path, "rb") as file_obj:
             return file_obj.read()
 
-    def _is_valid_generated_file(self, file_name: str, content: bytes) -> bool:
+    def _is_valid_generated_file(self, file_name: str, content) -> bool:
         lower_name = file_name.lower()
         zip_like_suffixes = (
             ".xlsx",
@@ -1899,7 +4969,8 @@ except Exception:
             return True
 
         try:
-            with zipfile.ZipFile(BytesIO(content)) as zip_file:
+            source = BytesIO(content) if isinstance(content, (bytes, bytearray)) else content
+            with zipfile.ZipFile(source) as zip_file:
                 bad_member = zip_file.testzip()
                 if bad_member is not None:
                     logger.warning(
@@ -1922,19 +4993,9 @@ except Exception:
         logger.info(f"[E2B] Exported file sent successfully: {path_obj.name}")
 
     def _write_export_file(self, file_name: str, content: bytes):
-        export_dir = self._get_export_dir()
-        export_dir.mkdir(parents=True, exist_ok=True)
-
         safe_name = self._sanitize_filename(file_name)
-        target = export_dir / safe_name
-        stem = target.stem
-        suffix = target.suffix
-        index = 1
-        while target.exists():
-            target = export_dir / f"{stem}_{index}{suffix}"
-            index += 1
-
         try:
+            target = self._reserve_export_path(file_name)
             with open(target, "wb") as file_obj:
                 file_obj.write(content)
             return target
@@ -1942,6 +5003,23 @@ except Exception:
             logger.error(f"[E2B] Failed to write export file {safe_name}: {exc}")
             return None
 
+    def _reserve_export_path(self, file_name: str):
+        export_dir = self._get_export_dir()
+        export_dir.mkdir(parents=True, exist_ok=True)
+
+        safe_name = self._sanitize_filename(file_name)
+        target = export_dir / safe_name
+        stem = target.stem
+        suffix = target.suffix
+        index = 1
+        while True:
+            try:
+                with open(target, "xb"):
+                    return target
+            except FileExistsError:
+                target = export_dir / f"{stem}_{index}{suffix}"
+                index += 1
+
     def _cleanup_export_cache(self):
         export_dir = self._get_export_dir()
         if not export_dir.exists():
@@ -1965,34 +5043,110 @@ except Exception:
             except Exception as exc:
                 logger.warning(f"[E2B] Failed to cleanup export cache {path}: {exc}")
 
-    def _cleanup_session_cache(self):
-        now = time.time()
-        cutoff = now - DEFAULT_SESSION_RETENTION_HOURS * 3600
-        expired_session_ids = [
-            session_id
-            for session_id, last_access in self.session_last_access.items()
-            if last_access < cutoff and session_id not in self.sandbox_sessions
-        ]
-
-        for session_id in expired_session_ids:
-            self.session_last_access.pop(session_id, None)
-            self.code_hashes.pop(session_id, None)
-            self.code_hash_timestamps.pop(session_id, None)
-            self.session_files.pop(session_id, None)
-            self.generated_files.pop(session_id, None)
-            self.sent_file_signatures.pop(session_id, None)
-            self.session_locks.pop(session_id, None)
-            logger.info(f"[E2B] Cleaned expired session cache: {session_id}")
-
     def _mark_session_active(self, event: AstrMessageEvent):
         session_id = self._get_session_id(event)
         self.session_last_access[session_id] = time.time()
-        if len(self.session_last_access) % 20 == 0:
-            self._cleanup_session_cache()
+        self._ensure_background_tasks()
+        self._schedule_session_expiry(session_id)
 
     def _get_export_dir(self):
         return self._plugin_data_dir / DEFAULT_EXPORT_DIRNAME
 
+    def _get_output_spool_dir(self, session_id: str):
+        session_key = hashlib.md5(str(session_id).encode("utf-8")).hexdigest()[:16]
+        return self._plugin_data_dir / OUTPUT_SPOOL_DIRNAME / session_key
+
+    def _finish_output_spool(self, spool: OutputSpool):
+        spool.close()
+        session_dir = spool.directory.parent
+        if not session_dir.exists():
+            return
+        executions = sorted(
+            (path for path in session_dir.iterdir() if path.is_dir()),
+            key=lambda path: path.stat().st_mtime,
+            reverse=True,
+        )
+        for path in executions[MAX_SPOOLED_EXECUTIONS:]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _find_spooled_execution(self, session_id: str, execution_id: str):
+        session_dir = self._get_output_spool_dir(session_id)
+        if execution_id:
+            path = session_dir / self._basename(execution_id)
+            return path if (path / "meta.json").exists() else None
+        if not session_dir.exists():
+            return None
+        executions = [path for path in session_dir.iterdir() if (path / "meta.json").exists()]
+        if not executions:
+            return None
+        return max(executions, key=lambda path: path.stat().st_mtime)
+
+    def _read_spooled_output(
+        self,
+        path: Path,
+        offset: int,
+        length: int,
+        start_line: int,
+        end_line: int,
+        pattern: str,
+        limit: int,
+    ):
+        with gzip.open(path, "rt", encoding="utf-8") as file_obj:
+            if pattern:
+                pattern = pattern[:MAX_OUTPUT_PATTERN_LENGTH]
+                matches = []
+                match_count = 0
+                used = 0
+                scanned = 0
+                scan_stopped_at = 0
+                for line_number, line in enumerate(file_obj, start=1):
+                    if line_number < start_line:
+                        continue
+                    scanned += len(line)
+                    if scanned > MAX_OUTPUT_PATTERN_SCAN_CHARS:
+                        scan_stopped_at = line_number
+                        break
+                    if pattern not in line:
+                        continue
+                    match_count += 1
+                    entry = f"{line_number}: {line.rstrip()}"
+                    if used + len(entry) <= limit:
+                        matches.append(entry)
+                        used += len(entry) + 1
+                header = f"{match_count} matching line(s)"
+                if len(matches) < match_count:
+                    header += f", showing the first {len(matches)}"
+                if scan_stopped_at:
+                    header += (
+                        f"; search stopped at line {scan_stopped_at} after {MAX_OUTPUT_PATTERN_SCAN_CHARS} "
+                        "characters, use start_line to search further"
+                    )
+                return header, "\n".join(matches)
+
+            if start_line or end_line:
+                first = max(1, start_line or 1)
+                last = end_line if end_line >= first else first + 199
+                lines = []
+                used = 0
+                for line_number, line in enumerate(file_obj, start=1):
+                    if line_number < first:
+                        continue
+                    if line_number > last or used + len(line) > limit:
+                        break
+                    lines.append(line)
+                    used += len(line)
+                shown_last = first + len(lines) - 1
+                return f"lines {first}-{shown_last}", "".join(lines)
+
+            remaining = max(0, offset)
+            while remaining:
+                skipped = file_obj.read(min(remaining, 1024 * 1024))
+                if not skipped:
+                    break
+                remaining -= len(skipped)
+            content = file_obj.read(min(length or limit, limit))
+            return f"characters {offset}-{offset + len(content)}", content
+
     def _sanitize_filename(self, file_name: str):
         name = os.path.basename(file_name).strip() or "exported_file"
         return re.sub(r'[<>:"/\\\\|?*]', "_", name)
@@ -2000,14 +5154,11 @@ except Exception:
     def _basename(self, file_name: str):
         return os.path.basename(file_name.replace("\\", "/"))
 
-    def _parse_int_output(self, command_result):
+    def _command_stdout(self, command_result):
         stdout = getattr(command_result, "stdout", "") or ""
         if isinstance(stdout, list):
             stdout = "".join(stdout)
-        try:
-            return int(str(stdout).strip())
-        except (TypeError, ValueError):
-            return None
+        return str(stdout)
 
     def _get_session_id(self, event: AstrMessageEvent):
         return (
@@ -2027,13 +5178,50 @@ except Exception:
 
         return str(value)
 
-    def _merge_chunks(self, chunks):
-        return "".join(chunk for chunk in chunks if chunk).strip()
+    def _new_output_capture(self, output_limit: int, spool: OutputSpool = None, stream: str = ""):
+        # Keep enough of each end to render any share of the limit the stream is given later.
+        return OutputCapture(
+            head_limit=output_limit,
+            tail_limit=output_limit,
+            spool=spool,
+            stream=stream,
+        )
+
+    def _render_output_sections(self, sections, budget: int):
+        sections = [(label, capture) for label, capture in sections if capture.total_chars]
+        remaining = max(0, budget - sum(len(label) + 4 for label, _ in sections))
+        shares = {}
+
+        # Tracebacks matter most: stderr is served first, with up to two thirds when other streams have output.
+        stderr = next((capture for label, capture in sections if label == "STDERR"), None)
+        others = sorted(
+            (capture for label, capture in sections if label != "STDERR"),
+            key=lambda capture: capture.total_chars,
+        )
+        if stderr is not None:
+            cap = remaining * 2 // 3 if others else remaining
+            shares[id(stderr)] = min(stderr.total_chars, cap)
+            remaining -= shares[id(stderr)]
+        for index, capture in enumerate(others):
+            shares[id(capture)] = min(capture.total_chars, remaining // (len(others) - index))
+            remaining -= shares[id(capture)]
+        if stderr is not None:
+            shares[id(stderr)] += min(remaining, stderr.total_chars - shares[id(stderr)])
+
+        rendered = []
+        truncated = False
+        for label, capture in sections:
+            text, cut = capture.render(shares[id(capture)])
+            truncated = truncated or cut
+            if text:
+                rendered.append(f"{label}:\n{text}")
+        return "\n\n".join(rendered), truncated
 
     def _truncate(self, text: str, limit: int):
         if len(text) <= limit:
             return text
-        return text[:limit] + "\n...(Output truncated)"
+        head_limit = limit * 2 // 3
+        return text[:head_limit] + "\n...(Output truncated)...\n" + text[-(limit - head_limit):]
 
     def _safe_int(self, value, default, minimum=None, maximum=None):
         try: